@@ -0,0 +1,116 @@
+# Annual aggregation of the combined drought and precipitation data
+import numpy as np
+import pandas as pd
+
+from dataTypes import compactDtypes
+from groupedStats import correlationMoments, corrByYearFromMoments, yearlySummary
+from instrumentation import instrumented
+
+
+# decimals of the pdsi and precipitation values in the NOAA sources
+sourceDecimals = 2
+
+
+def sourceMeans(dfValues: pd.DataFrame, keys: list, column: str):
+    """Mean of a source column for every group, rounded like round(Series.mean(), 2) per group
+
+    The values are summed exactly as integer hundredths, so a rounded mean only depends on
+    float error when it lies on a .xx5 tie. Those groups are averaged with Series.mean like
+    the original per group loop, every other mean is exact
+
+    Parameters:
+    dfValues: pd.DataFrame - the key columns and column, values with at most sourceDecimals decimals
+    keys: list - grouping columns
+    column: str - column averaged
+
+    Returns:
+    means: np.ndarray - float64 mean of every group, in sorted group order, NaN for groups
+        without values
+    """
+    scale = 10 ** sourceDecimals
+    units = np.rint(dfValues[column].to_numpy(dtype='float64') * scale)
+    grouped = pd.Series(units, index=dfValues.index).groupby(
+        [dfValues[key] for key in keys], sort=True, observed=True)
+    total = grouped.sum().to_numpy()
+    count = grouped.count().to_numpy().astype('float64')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # half units round away from zero here, ties are settled below
+        rounded = np.floor((2 * total + count) / (2 * count))
+        tie = (count > 0) & (np.fmod(2 * total, count) == 0) & (np.fmod(2 * total / count, 2) != 0)
+    means = np.where(count > 0, rounded / scale, np.nan)
+
+    if (tie.any()):
+        tieRows = tie[grouped.ngroup().to_numpy()]
+        dfTies = dfValues.loc[tieRows]
+        means[tie] = dfTies.groupby(keys, sort=True, observed=True)[column].agg(
+            lambda values: round(values.mean(), sourceDecimals)).to_numpy()
+    return means
+
+
+@instrumented(category='aggregate')
+def getAverageAnnual(dfCombined: pd.DataFrame, counties: np.array, years: np.array, stats: list = None):
+    """get the annual PDSI average by county
+
+    Parameters:
+    dfCombined: pd.DataFrame - combined drought and precip data
+    counties: np.array - np array counties
+    stats?: list - extra aggregations for pdsi and precip ('min', 'max', 'std', 'count', ...)
+        each adds a pdsi<Stat> and precip<Stat> column, e.g. 'max' -> pdsiMax, precipMax
+
+    Returns:
+    dfPDSI: pd.DataFrame - dataframe with annual average PDSI
+    """
+    print('Calculating Averages Consolidated Annually ========================')
+    aggregations = {'stateFips': ('state_fips', 'first')}
+    for stat in (stats or []):
+        aggregations['pdsi' + stat.capitalize()] = ('pdsi', stat)
+        aggregations['precip' + stat.capitalize()] = ('rainfall', stat)
+
+    # the float32 measurements are widened and rounded back to the source decimals, the
+    # float64 values the original loop read from the csvs
+    dfValues = dfCombined[['county_fips', 'year', 'state_fips']].assign(
+        pdsi=dfCombined['pdsi'].astype('float64').round(sourceDecimals),
+        rainfall=dfCombined['rainfall'].astype('float64').round(sourceDecimals))
+
+    # single pass over the sorted (county, year) groups for every statistic
+    keys = ['county_fips', 'year']
+    dfAnnualMeans = dfValues.groupby(
+        keys, sort=True, observed=True).agg(**aggregations).round(2)
+    # the means are rounded tie for tie like the per group loop, see sourceMeans
+    dfAnnualMeans.insert(1, 'pdsiAvg', sourceMeans(dfValues, keys, 'pdsi'))
+    dfAnnualMeans.insert(2, 'precipAvg', sourceMeans(dfValues, keys, 'rainfall'))
+    dfAnnualMeans = dfAnnualMeans.reset_index().rename(
+        columns={'county_fips': 'countyFips'})
+    dfAnnualMeans = dfAnnualMeans[['year', 'countyFips', 'stateFips', 'pdsiAvg', 'precipAvg'] +
+                                  list(aggregations.keys())[1:]]
+    dfAnnualMeans = compactDtypes(dfAnnualMeans, 'Annual Means')
+    print('Finished gathering counties')
+
+    return dfAnnualMeans
+
+
+def annualPdsiPrecipCorr(dfCombinedDroughtRainData: pd.DataFrame, years, method='pearson'):
+    """Correlation of monthly pdsi and rainfall for each year, grouped in one pass
+
+    Parameters:
+    dfCombinedDroughtRainData: pd.DataFrame - combined drought and rain data
+    years: int[] - years to report, in order
+    method?: str - 'pearson' or 'spearman'
+
+    Returns:
+    dfCorrCoeff: pd.DataFrame - year, corrCoeff (years without data are NaN, zero is dropped)
+    """
+    return corrByYearFromMoments(correlationMoments(
+        dfCombinedDroughtRainData, 'year', 'pdsi', 'rainfall', method), years)
+
+
+def annualPrecipCombined(dfAnnualMeans: pd.DataFrame, years):
+    dfSummary = yearlySummary(dfAnnualMeans, years, ['precipAvg'], [])
+    dfAnnualPrecipCombined = pd.DataFrame(data={'year': years,
+                                                'precipAvg': dfSummary['precipAvgMean'].to_numpy(),
+                                                'precipMedian': dfSummary['precipAvgMedian'].to_numpy()})
+    dfAnnualPrecipCombined = dfAnnualPrecipCombined.loc[(dfAnnualPrecipCombined['precipAvg'] != 0)
+                                                        & (dfAnnualPrecipCombined['precipMedian'] != 0)]
+
+    return dfAnnualPrecipCombined.reset_index(drop=True)
@@ -0,0 +1,245 @@
+# Dense year x county x metric array of the annual means with integer year and fips indexes
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+cubeMetrics = ['pdsiAvg', 'precipAvg']
+
+
+def buildAnnualCube(dfAnnualMeans: pd.DataFrame, metrics: list = cubeMetrics):
+    """Scatter the annual means into a years x counties x metrics array, county years
+    without data are NaN
+
+    Parameters:
+    dfAnnualMeans: pd.DataFrame - 'year', 'countyFips' and the metric columns, as aggregation.getAverageAnnual,
+        one row per year and county; rows without a year or county fips are left out
+    metrics?: list - metric columns, in the order of the last axis
+
+    Returns:
+    cube: dict - 'values': np.ndarray (years, counties, metrics), 'years': sorted years,
+        'counties': sorted county fips, 'metrics', 'yearIndex': year -> row,
+        'countyIndex': fips -> column, 'metricIndex': metric -> layer
+    """
+    # a missing fips would become a county 'nan' of a state 'na' once turned into a string
+    hasKeys = dfAnnualMeans['year'].notna() & dfAnnualMeans['countyFips'].notna()
+    if (not hasKeys.all()):
+        print('Left {0} annual means without a year or county fips out of the cube'.format(
+            int((~hasKeys).sum())))
+        dfAnnualMeans = dfAnnualMeans.loc[hasKeys]
+    yearCodes, years = pd.factorize(dfAnnualMeans['year'], sort=True)
+    countyCodes, counties = pd.factorize(dfAnnualMeans['countyFips'].astype(str), sort=True)
+    flatIndex = yearCodes.astype('int64') * len(counties) + countyCodes
+    if (len(np.unique(flatIndex)) != len(flatIndex)):
+        # a later row would silently overwrite an earlier one
+        raise ValueError('Annual means hold duplicate (year, countyFips) rows')
+    dtype = np.result_type(*[dfAnnualMeans[metric].dtype for metric in metrics])
+
+    values = np.full((len(years), len(counties), len(metrics)), np.nan, dtype=dtype)
+    values[yearCodes, countyCodes] = dfAnnualMeans[metrics].to_numpy(dtype=dtype)
+    return cubeFromArrays(values, np.asarray(years), np.asarray(counties, dtype=str), metrics)
+
+
+def annualMeansFingerprint(dfAnnualMeans: pd.DataFrame, metrics: list = cubeMetrics):
+    """sha256 of the year, county, and metric values, a saved cube is only reused for the
+    annual means it was built from"""
+    hashes = pd.util.hash_pandas_object(
+        dfAnnualMeans[['year', 'countyFips'] + list(metrics)], index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def cubeFromArrays(values: np.ndarray, years: np.ndarray, counties: np.ndarray, metrics: list):
+    """Assemble a cube dict and its lookup indexes from the array and its axes"""
+    return {'values': values, 'years': years, 'counties': counties, 'metrics': list(metrics),
+            'yearIndex': {int(year): i for i, year in enumerate(years)},
+            'countyIndex': {str(fips): j for j, fips in enumerate(counties)},
+            'metricIndex': {metric: k for k, metric in enumerate(metrics)}}
+
+
+def saveAnnualCube(cube: dict, path: str = 'sourceData/cache/annualCube', fingerprint: str = None):
+    """Write the cube to a directory, values.npy holds the array and axes.json the years,
+    county fips, and metrics of its axes
+
+    Parameters:
+    cube: dict - see buildAnnualCube
+    path?: str - cube directory
+    fingerprint?: str - annualMeansFingerprint of the source frame, checked by loadAnnualCube
+    """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'values.npy'), cube['values'])
+    with open(os.path.join(path, 'axes.json'), 'w') as f:
+        json.dump({'years': [int(year) for year in cube['years']],
+                   'counties': [str(fips) for fips in cube['counties']],
+                   'metrics': cube['metrics'], 'fingerprint': fingerprint}, f)
+
+
+def loadAnnualCube(path: str = 'sourceData/cache/annualCube', mmap: bool = True,
+                   fingerprint: str = None):
+    """Load a saved cube, None if there is none or it was built from other annual means
+
+    Parameters:
+    path?: str - cube directory
+    mmap?: bool - memory map values.npy read only instead of reading it into memory
+    fingerprint?: str - annualMeansFingerprint the saved cube must match
+
+    Returns:
+    cube: dict - see buildAnnualCube
+    """
+    valuesPath = os.path.join(path, 'values.npy')
+    axesPath = os.path.join(path, 'axes.json')
+    if (not os.path.exists(valuesPath) or not os.path.exists(axesPath)):
+        return None
+    with open(axesPath) as f:
+        axes = json.load(f)
+    if (fingerprint != None and axes.get('fingerprint') != fingerprint):
+        return None
+    values = np.load(valuesPath, mmap_mode='r' if mmap else None)
+    return cubeFromArrays(values, np.array(axes['years'], dtype='int16'),
+                          np.array(axes['counties']), axes['metrics'])
+
+
+def yearSlice(cube: dict, year: int, metric: str = None):
+    """Values of every county for a year, a view of the cube
+
+    Returns:
+    np.ndarray - (counties, metrics), or (counties,) for one metric
+    """
+    values = cube['values'][cube['yearIndex'][int(year)]]
+    return values if metric == None else values[:, cube['metricIndex'][metric]]
+
+
+def countySeries(cube: dict, countyFips: str, metric: str = None):
+    """Values of a county for every year, a view of the cube
+
+    Returns:
+    np.ndarray - (years, metrics), or (years,) for one metric
+    """
+    values = cube['values'][:, cube['countyIndex'][str(countyFips)]]
+    return values if metric == None else values[:, cube['metricIndex'][metric]]
+
+
+def yearFrame(cube: dict, year: int):
+    """Annual means of the counties with data in a year
+
+    Counties whose metrics are all NaN are left out, a source row holding only NaN metrics
+    is therefore not returned
+
+    Returns:
+    dfYear: pd.DataFrame - 'year', 'countyFips' and the metric columns, empty for a year
+        outside the cube
+    """
+    columns = ['year', 'countyFips'] + cube['metrics']
+    if (int(year) not in cube['yearIndex']):
+        return pd.DataFrame(columns=columns)
+    values = yearSlice(cube, year)
+    hasData = ~np.isnan(values).all(axis=1)
+    dfYear = pd.DataFrame(values[hasData], columns=cube['metrics'])
+    dfYear.insert(0, 'countyFips', cube['counties'][hasData])
+    dfYear.insert(0, 'year', np.int16(year))
+    return dfYear[columns]
+
+
+def periodThresholds(cube: dict, thresholds: pd.Series, period: str = 'all'):
+    """Thresholds of a period lined up with the cube axes
+
+    Parameters:
+    cube: dict - see buildAnnualCube
+    thresholds: pd.Series - one threshold for 'all', or indexed by year, decade, or state fips
+        like groupedStats.groupedQuantiles
+    period?: str - 'all', 'year', 'decade' or 'state'
+
+    Returns:
+    float | np.ndarray - broadcasts against a (years, counties) layer
+    """
+    if (period == 'all'):
+        return float(thresholds.iloc[0]) if isinstance(thresholds, pd.Series) else float(thresholds)
+    if (period == 'year'):
+        return thresholds.reindex(cube['years']).to_numpy(dtype='float64')[:, None]
+    if (period == 'decade'):
+        return thresholds.reindex(cube['years'] // 10 * 10).to_numpy(dtype='float64')[:, None]
+    if (period == 'state'):
+        # the first two digits of a county fips are its state fips
+        stateFips = pd.Index(thresholds.index.astype(str))
+        return pd.Series(thresholds.to_numpy(), index=stateFips).reindex(
+            [fips[:2] for fips in cube['counties']]).to_numpy(dtype='float64')[None, :]
+    raise ValueError('Unsupported quantile period: {0}'.format(period))
+
+
+def quartileMasks(cube: dict, metric: str, lower, upper):
+    """County years at or below the lower and at or above the upper threshold
+
+    Parameters:
+    cube: dict - see buildAnnualCube
+    metric: str - layer compared
+    lower: float | np.ndarray - lower threshold, see periodThresholds
+    upper: float | np.ndarray - upper threshold
+
+    Returns:
+    masks: dict - 'q1', 'q3' bool arrays (years, counties), county years without data are False
+    """
+    values = cube['values'][:, :, cube['metricIndex'][metric]]
+    return {'q1': values <= lower, 'q3': values >= upper}
+
+
+def maskedFrame(cube: dict, mask: np.ndarray):
+    """Annual means of the county years in a mask, ordered by county and year like the
+    annual means frame
+
+    Returns:
+    df: pd.DataFrame - 'year', 'countyFips' and the metric columns
+    """
+    yearRows, countyColumns = np.nonzero(mask)
+    order = np.lexsort((yearRows, countyColumns))
+    yearRows = yearRows[order]
+    countyColumns = countyColumns[order]
+    df = pd.DataFrame(cube['values'][yearRows, countyColumns], columns=cube['metrics'])
+    df.insert(0, 'countyFips', cube['counties'][countyColumns])
+    df.insert(0, 'year', cube['years'][yearRows])
+    return df
+
+
+def cubeYearlySummary(cube: dict, years=None, mask: np.ndarray = None):
+    """groupedStats.yearlySummary without quantiles, reduced over the county axis of the cube
+
+    Parameters:
+    cube: dict - see buildAnnualCube
+    years?: int[] - years to report, in order; years without data get count and sum 0
+    mask?: np.ndarray - (years, counties) county years to summarize, default all
+
+    Returns:
+    dfSummary: pd.DataFrame - indexed by year, columns <metric>Count, <metric>Sum,
+        <metric>Mean and <metric>Median
+    """
+    # one metric layer is widened at a time, never a float64 copy of the whole cube
+    dtype = cube['values'].dtype
+    summary = {}
+    for k, metric in enumerate(cube['metrics']):
+        values = cube['values'][:, :, k].astype('float64')
+        if (mask is not None):
+            values[~mask] = np.nan
+        count = (~np.isnan(values)).sum(axis=1)
+        total = np.nansum(values, axis=1)
+        with warnings.catch_warnings():
+            # years without any selected county have a NaN mean and median
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = total / np.where(count > 0, count, np.nan)
+            median = np.nanmedian(values, axis=1)
+
+        # rounded to the cube dtype like the pandas groupby results of float32 columns
+        summary[metric + 'Count'] = count.astype('float64')
+        summary[metric + 'Sum'] = total.astype(dtype).astype('float64')
+        summary[metric + 'Mean'] = mean.astype(dtype).astype('float64')
+        summary[metric + 'Median'] = median.astype(dtype).astype('float64')
+    dfSummary = pd.DataFrame(summary, index=pd.Index(cube['years'], name='year'))
+
+    if (years is not None):
+        dfSummary = dfSummary.reindex(pd.Index(years).astype(dfSummary.index.dtype))
+        for metric in cube['metrics']:
+            dfSummary[[metric + 'Count', metric + 'Sum']] = dfSummary[[
+                metric + 'Count', metric + 'Sum']].fillna(0)
+    dfSummary.index.name = 'year'
+    return dfSummary
@@ -0,0 +1,382 @@
+# Benchmarks comparing the vectorized pipeline stages against the original row loops
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from dataCache import sourceFiles, ingestCleanSource
+from dataClean import ingestCSV, cleanFipsCols, cleanRainfallData, cleanFips, addThreeDigitFipsToCounties
+from machineLearning import concatData, getAnnualQuantileCountyDatasetPdsi, getAnnualQuantileCountyDatasetPrecip
+from aggregation import getAverageAnnual, annualPrecipCombined, annualPdsiPrecipCorr
+from parallelPipeline import runStatePartitioned
+from sqlAggregation import getAverageAnnualSql, annualPrecipCombinedSql, annualPdsiPrecipCorrSql
+from syntheticData import generateSyntheticSources
+
+
+def concatDataLoop(dfDrought: pd.DataFrame, dfRain: pd.DataFrame, dfStates: pd.DataFrame):
+    """Original itertuples implementation of concatData kept as the benchmark baseline
+
+    Parameters:
+    dfDrought: pd.DataFrame - drought data
+    dfRain: pd.DataFrame - rainfall data
+    dfStates: pd.DataFrame - state data
+
+    Returns:
+    dataset: pd.DataFrame - year, month, county_fips, pdsi, rainfall, state_fips
+    """
+    dfMergeRain = pd.merge(
+        dfRain, dfStates, left_on='state_id', right_on='noaa_state_fips')
+
+    dfMergeRain = dfMergeRain.drop(['state_id'], axis=1)
+    dfMergeRain['countyfips'] = dfMergeRain['state_fips'] + \
+        dfMergeRain['county_id']
+
+    dfMergeRain['year'] = dfMergeRain['year'].astype(int)
+    dfDrought['year'] = dfDrought['year'].astype(int)
+
+    dfMergeRainDrought = pd.merge(dfDrought, dfMergeRain, on=[
+                                  'year', 'countyfips'], how='left')
+
+    # month translation dict for tuple index
+    months = {1: 6, 2: 7, 3: 8, 4: 9, 5: 10, 6: 11,
+              7: 12, 8: 13, 9: 14, 10: 15, 11: 16, 12: 17}
+    dataForDF = {'year': [], 'month': [], 'county_fips': [],
+                 'pdsi': [], 'rainfall': [], 'state_fips': []}
+    for row in dfMergeRainDrought.itertuples(index=False):
+        dataForDF['year'].append(row[0])
+        dataForDF['month'].append(row[1])
+        dataForDF['county_fips'].append(row[3])
+        dataForDF['pdsi'].append(row[4])
+        dataForDF['rainfall'].append(row[months[row[1]]])
+        dataForDF['state_fips'].append(row[2])
+
+    return pd.DataFrame(data=dataForDF)
+
+
+def loadBenchmarkSources(rainPath: str = 'sourceData/climdiv-pcpncy-v1.0.0-20220108.csv'):
+    """Ingest and clean the drought, state and rain sources the same way main does
+
+    Parameters:
+    rainPath: str - climdiv csv location
+
+    Returns:
+    dfDrought, dfStates, dfRain: pd.DataFrame
+    """
+    dfDrought = ingestCSV()
+    dfStates = ingestCSV('sourceData/states.csv')
+    dfRain = ingestCSV(rainPath)
+
+    dfDrought = cleanFipsCols(dfDrought, 'countyfips', 5)
+    dfDrought = cleanFipsCols(dfDrought, 'statefips', 2)
+    dfStates = cleanFipsCols(dfStates, 'noaa_state_fips', 2)
+    dfStates = cleanFipsCols(dfStates, 'state_fips', 2)
+    dfRain = cleanFipsCols(dfRain, 'id_code', 11)
+    dfRain = cleanRainfallData(dfRain)
+
+    return dfDrought, dfStates, dfRain
+
+
+def benchmarkConcatData(repeat: int = 3):
+    """Time the vectorized concatData against the original row loop on the full climdiv file
+
+    Parameters:
+    repeat: int - number of timed runs for each implementation
+
+    Returns:
+    timings: dict - best seconds for 'loop' and 'vectorized'
+    """
+    dfDrought, dfStates, dfRain = loadBenchmarkSources()
+
+    timings = {}
+    results = {}
+    for label, func in (('loop', concatDataLoop), ('vectorized', concatData)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[label] = func(dfDrought.copy(), dfRain, dfStates)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+        print('concatData {0}: {1:.2f}s ({2} rows)'.format(
+            label, best, len(results[label].index)))
+
+    pd.testing.assert_frame_equal(
+        results['loop'], results['vectorized'], check_dtype=False, check_categorical=False)
+    print('concatData speedup: {0:.1f}x'.format(
+        timings['loop'] / timings['vectorized']))
+
+    return timings
+
+
+def timeBest(func, repeat: int):
+    """Run func repeat times and return (best seconds, last result)"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def benchmarkComputeEngines(repeat: int = 3):
+    """Time the pandas and SQL engines for the annual means and correlations
+    the SQL engine reads the pdsi_precip table, which must already be populated
+
+    Parameters:
+    repeat: int - number of timed runs for each engine
+
+    Returns:
+    timings: dict - stage -> {'pandas': seconds, 'sql': seconds}
+    """
+    dfDrought, dfStates, dfRain = loadBenchmarkSources()
+    years = dfDrought['year'].unique()
+
+    # the pandas engine starts from the combined frame, as in main
+    concatSeconds, dfCombined = timeBest(
+        lambda: concatData(dfDrought.copy(), dfRain, dfStates), 1)
+    dfAnnualMeans = getAverageAnnual(dfCombined, None, years)
+
+    stages = {
+        'annualMeans': (lambda: getAverageAnnual(dfCombined, None, years),
+                        lambda: getAverageAnnualSql()),
+        'annualPrecipCombined': (lambda: annualPrecipCombined(dfAnnualMeans, years),
+                                 lambda: annualPrecipCombinedSql(years)),
+        'annualPdsiPrecipCorr': (lambda: annualPdsiPrecipCorr(dfCombined, years),
+                                 lambda: annualPdsiPrecipCorrSql(years))
+    }
+
+    timings = {}
+    for stage, (pandasFunc, sqlFunc) in stages.items():
+        pandasSeconds, _ = timeBest(pandasFunc, repeat)
+        sqlSeconds, _ = timeBest(sqlFunc, repeat)
+        timings[stage] = {'pandas': pandasSeconds, 'sql': sqlSeconds}
+        print('{0}: pandas {1:.2f}s | sql {2:.2f}s'.format(
+            stage, pandasSeconds, sqlSeconds))
+    print('concatData (pandas engine only): {0:.2f}s'.format(concatSeconds))
+
+    return timings
+
+
+def benchmarkParallelScaling(workerCounts: list = None, repeat: int = 1):
+    """Time the state partitioned clean, merge, and aggregate stages across worker counts
+    against the single frame pandas engine
+
+    Parameters:
+    workerCounts?: list - process pool sizes to time, default [1, 2, 4, 8]
+    repeat?: int - number of timed runs for each size
+
+    Returns:
+    timings: dict - 'pandas' and worker count -> best seconds
+    """
+    workerCounts = workerCounts or [1, 2, 4, 8]
+    dfDrought, dfStates, dfRain = loadBenchmarkSources()
+    dfCounties = ingestCleanSource('counties', sourceFiles['counties'])
+    years = dfDrought['year'].unique()
+
+    timings = {}
+    timings['pandas'], dfAnnualMeans = timeBest(lambda: getAverageAnnual(
+        concatData(dfDrought.copy(), dfRain, dfStates), None, years), repeat)
+    print('pandas engine: {0:.2f}s'.format(timings['pandas']))
+
+    for workers in workerCounts:
+        timings[workers], result = timeBest(lambda: runStatePartitioned(
+            dfDrought, dfRain, dfCounties, dfStates, years, workers), repeat)
+        pd.testing.assert_frame_equal(dfAnnualMeans, result['annualMeans'], check_dtype=False,
+                                      check_categorical=False, atol=0.0101)
+        print('{0} workers: {1:.2f}s ({2:.1f}x vs {3} workers, {4:.1f}x vs pandas)'.format(
+            workers, timings[workers], timings[workerCounts[0]] / timings[workers],
+            workerCounts[0], timings['pandas'] / timings[workers]))
+
+    return timings
+
+
+def profileStage(func, repeat: int = 1):
+    """Time a stage and measure the peak memory it allocates
+    timing runs are untraced, a last traced run measures the peak since tracemalloc
+    slows allocation heavy code down
+
+    Parameters:
+    func: function - stage to run, without arguments
+    repeat?: int - number of timed runs
+
+    Returns:
+    profile: dict - 'seconds' best wall time, 'peakMB' traced peak, 'rows', and 'result'
+    """
+    seconds, result = timeBest(func, repeat)
+    tracemalloc.start()
+    try:
+        func()
+        peakMB = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    finally:
+        tracemalloc.stop()
+    rows = len(result.index) if isinstance(result, (pd.DataFrame, pd.Series)) else None
+    return {'seconds': seconds, 'peakMB': peakMB, 'rows': rows, 'result': result}
+
+
+def benchmarkPipeline(counties: int = 3000, years: int = 120, states: int = 50, repeat: int = 1,
+                      includeExports: bool = False, outDir: str = 'sourceData/synthetic',
+                      resultsPath: str = None):
+    """Time and memory profile each stage of main.main on synthetic data
+
+    The database stages are not part of the run, exports need Kaleido and the
+    visualizations directories so they are opt in
+
+    Parameters:
+    counties?: int - synthetic counties
+    years?: int - synthetic years
+    states?: int - synthetic states
+    repeat?: int - number of timed runs for each stage
+    includeExports?: bool - also time the line and bubble chart exports
+    outDir?: str - directory for the synthetic sources
+    resultsPath?: str - json results location, default <outDir>/benchmark-<counties>x<years>.json
+
+    Returns:
+    results: dict - scale, environment, and stage -> seconds, peakMB, rows
+    """
+    sources = generateSyntheticSources(outDir, counties, years, states)
+    stageResults = {}
+
+    def stage(name, func):
+        profile = profileStage(func, repeat)
+        stageResults[name] = {key: value for key, value in profile.items() if key != 'result'}
+        print('{0}: {1:.3f}s, peak {2:.1f} MB{3}'.format(
+            name, profile['seconds'], profile['peakMB'],
+            '' if profile['rows'] is None else ', {0} rows'.format(profile['rows'])))
+        return profile['result']
+
+    dfDrought = stage('ingestCSV drought', lambda: ingestCSV(sources['drought']))
+    dfRain = stage('ingestCSV rain', lambda: ingestCSV(sources['rain']))
+    dfCounties = stage('ingestCSV counties', lambda: ingestCSV(sources['counties']))
+    dfStates = stage('ingestCSV states', lambda: ingestCSV(sources['states']))
+
+    dfDrought = stage('cleanFipsCols', lambda: cleanFipsCols(
+        cleanFipsCols(dfDrought, 'countyfips', 5), 'statefips', 2))
+    dfStates = cleanFipsCols(cleanFipsCols(dfStates, 'noaa_state_fips', 2), 'state_fips', 2)
+    dfCounties = addThreeDigitFipsToCounties(cleanFipsCols(dfCounties, 'county_fips', 5))
+    dfRain = stage('cleanRainfallData', lambda: cleanRainfallData(
+        cleanFipsCols(dfRain.copy(), 'id_code', 11)))
+    stage('cleanFips', lambda: cleanFips(dfDrought, dfCounties, dfStates))
+
+    yearValues = dfDrought['year'].unique()
+    dfCombined = stage('concatData', lambda: concatData(dfDrought.copy(), dfRain, dfStates))
+    dfAnnualMeans = stage('getAverageAnnual', lambda: getAverageAnnual(
+        dfCombined, None, yearValues))
+    corrByYear = stage('annualPdsiPrecipCorr', lambda: annualPdsiPrecipCorr(
+        dfCombined, yearValues))
+    dfAnnualPrecipCombined = stage('annualPrecipCombined', lambda: annualPrecipCombined(
+        dfAnnualMeans, yearValues))
+    corrAvg = stage('corrAvg', lambda: dfAnnualMeans[['pdsiAvg', 'precipAvg']].corr(
+        'pearson')['pdsiAvg']['precipAvg'])
+    annualPdsiQuantile = dfAnnualMeans['pdsiAvg'].quantile(q=[0.25, 0.75])
+    annualPrecipQuantile = dfAnnualMeans['precipAvg'].quantile(q=[0.25, 0.75])
+    quartilePdsi = stage('quantileDatasets', lambda: (
+        getAnnualQuantileCountyDatasetPdsi(dfAnnualMeans, annualPdsiQuantile, annualPrecipQuantile),
+        getAnnualQuantileCountyDatasetPrecip(dfAnnualMeans, annualPdsiQuantile, annualPrecipQuantile)))[0]
+
+    if (includeExports):
+        from visualization import lineChartPrecip, lineChartCorr, genBubbleChart
+        from figureExport import flushExports
+        from renderCache import setRenderCacheEnabled, cacheEnabled
+        # time the rendering and the file writes, not the render cache
+        setRenderCacheEnabled(False)
+        stage('export lineChartPrecip', lambda: (lineChartPrecip(
+            dfAnnualPrecipCombined, corrAvg, 'benchmarkPrecipAvg'), flushExports()))
+        stage('export lineChartCorr', lambda: (lineChartCorr(
+            corrByYear, corrAvg, 'benchmarkCorrelation'), flushExports()))
+        stage('export genBubbleChart', lambda: (genBubbleChart(
+            quartilePdsi.get('q1'), yearValues, 'Benchmark', 'Q1', 'benchmarkBubble', 'Benchmark kNN'),
+            flushExports()))
+        setRenderCacheEnabled(cacheEnabled)
+
+    results = {
+        'scale': {'counties': counties, 'years': years, 'states': states,
+                  'droughtRows': counties * years * 12},
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__,
+                        'numpy': np.__version__, 'machine': platform.machine(),
+                        'cpus': os.cpu_count()},
+        'repeat': repeat,
+        'createdAt': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stages': stageResults,
+        'totalSeconds': sum(result['seconds'] for result in stageResults.values())
+    }
+
+    resultsPath = resultsPath or os.path.join(
+        outDir, 'benchmark-{0}x{1}.json'.format(counties, years))
+    with open(resultsPath, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Pipeline total {0:.2f}s, results written to {1}'.format(
+        results['totalSeconds'], resultsPath))
+
+    return results
+
+
+def compareBenchmarkResults(resultsPath: str, baselinePath: str, tolerance: float = 0.2,
+                            minSeconds: float = 0.05):
+    """Report the stages that got slower or allocate more than a baseline run
+
+    Parameters:
+    resultsPath: str - json results of benchmarkPipeline
+    baselinePath: str - json results of an earlier run at the same scale
+    tolerance?: float - allowed relative increase, 0.2 is 20%
+    minSeconds?: float - smaller slowdowns are timer noise and never reported
+
+    Returns:
+    regressions: list - (stage, metric, baseline, current)
+    """
+    with open(resultsPath) as f:
+        results = json.load(f)
+    with open(baselinePath) as f:
+        baseline = json.load(f)
+    if (results['scale'] != baseline['scale']):
+        print('Benchmark scales differ: {0} vs {1}'.format(
+            results['scale'], baseline['scale']))
+
+    regressions = []
+    for name, current in results['stages'].items():
+        previous = baseline['stages'].get(name)
+        if (previous == None):
+            continue
+        for metric in ('seconds', 'peakMB'):
+            if (metric == 'seconds' and current[metric] - previous[metric] < minSeconds):
+                continue
+            if (current[metric] > previous[metric] * (1 + tolerance)):
+                regressions.append((name, metric, previous[metric], current[metric]))
+                print('REGRESSION {0} {1}: {2:.3f} -> {3:.3f}'.format(
+                    name, metric, previous[metric], current[metric]))
+    if (not regressions):
+        print('No stage regressed more than {0:.0%}'.format(tolerance))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pipeline benchmarks')
+    parser.add_argument('benchmark', nargs='?', default='concat',
+                        choices=['concat', 'engines', 'parallel', 'pipeline'])
+    parser.add_argument('--counties', type=int, default=3000)
+    parser.add_argument('--years', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--exports', action='store_true')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    args = parser.parse_args()
+
+    if (args.benchmark == 'concat'):
+        benchmarkConcatData()
+    elif (args.benchmark == 'engines'):
+        benchmarkComputeEngines()
+    elif (args.benchmark == 'parallel'):
+        benchmarkParallelScaling()
+    else:
+        results = benchmarkPipeline(args.counties, args.years, repeat=args.repeat,
+                                    includeExports=args.exports, resultsPath=args.output)
+        if (args.baseline):
+            compareBenchmarkResults(args.output or os.path.join(
+                'sourceData/synthetic', 'benchmark-{0}x{1}.json'.format(args.counties, args.years)),
+                args.baseline)
@@ -0,0 +1,183 @@
+# Content hashed parquet cache of the ingested and cleaned source data
+import hashlib
+import importlib.util
+import json
+import os
+
+import pandas as pd
+
+from dataClean import ingestCSV, cleanFipsCols, cleanRainfallData, addThreeDigitFipsToCounties
+from instrumentation import instrumented
+
+# checked without importing so runs that never touch the cache don't pay for pyarrow
+pyarrowAvailable = importlib.util.find_spec('pyarrow') != None
+
+
+sourceFiles = {'drought': 'sourceData/drought.csv',
+               'counties': 'sourceData/counties.csv',
+               'states': 'sourceData/states.csv',
+               'rain': 'sourceData/climdiv-pcpncy-v1.0.0-20220108.csv'}
+
+# fips style columns stored as categoricals in the cache files
+categoricalColumns = ['countyfips', 'statefips', 'county_fips', 'state_fips',
+                      'noaa_state_fips', 'fips_only', 'state_id', 'county_id']
+
+# version of ingestCleanSource and the ingestCSV dtypes the cache files were written with,
+# bump it when either changes so cached frames from the old cleaning are rebuilt
+cleaningVersion = 1
+
+
+def getFileFingerprint(path: str):
+    """Get the size, mtime, and sha256 content hash of a source file
+
+    Parameters:
+    path: str - file location
+
+    Returns:
+    fingerprint: dict - size, mtime, sha256
+    """
+    stat = os.stat(path)
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+
+
+def fingerprintMatches(path: str, fingerprint: dict):
+    """Check a source file against a stored fingerprint
+    size and mtime are compared first so a changed file is rejected without hashing it
+
+    Parameters:
+    path: str - file location
+    fingerprint: dict - size, mtime, sha256 from getFileFingerprint
+
+    Returns:
+    bool - file is unchanged
+    """
+    stat = os.stat(path)
+    if (stat.st_size != fingerprint.get('size') or stat.st_mtime_ns != fingerprint.get('mtime')):
+        return False
+    return getFileFingerprint(path)['sha256'] == fingerprint.get('sha256')
+
+
+def ingestCleanSource(name: str, path: str):
+    """Ingest a source csv and apply the cleaning steps for that source
+
+    Parameters:
+    name: str - 'drought', 'counties', 'states', or 'rain'
+    path: str - csv location
+
+    Returns:
+    df: pd.DataFrame - cleaned data
+    """
+    df = ingestCSV(path)
+    if (name == 'drought'):
+        df = cleanFipsCols(df, 'countyfips', 5)
+        df = cleanFipsCols(df, 'statefips', 2)
+    elif (name == 'counties'):
+        df = cleanFipsCols(df, 'county_fips', 5)
+        df = addThreeDigitFipsToCounties(df)
+    elif (name == 'states'):
+        df = cleanFipsCols(df, 'noaa_state_fips', 2)
+        df = cleanFipsCols(df, 'state_fips', 2)
+    elif (name == 'rain'):
+        df = cleanFipsCols(df, 'id_code', 11)
+        df = cleanRainfallData(df)
+    return df
+
+
+def writeCachedFrame(df: pd.DataFrame, cachePath: str):
+    """Write a cleaned frame to parquet with the fips columns as categoricals"""
+    dfCache = df.copy()
+    for column in categoricalColumns:
+        if (column in dfCache.columns):
+            dfCache[column] = dfCache[column].astype('category')
+    dfCache.to_parquet(cachePath, engine='pyarrow', index=False)
+
+
+def readCachedFrame(cachePath: str):
+    """Read a cached frame and restore the fips columns to the strings the cleaning code expects"""
+    df = pd.read_parquet(cachePath, engine='pyarrow')
+    for column in categoricalColumns:
+        if (column in df.columns):
+            # object keeps missing fips as NaN like a fresh clean, str would turn them into 'nan'
+            df[column] = df[column].astype(object)
+    return df
+
+
+@instrumented(category='ingest')
+def loadCleanedSource(name: str, path: str, cacheDir: str = 'sourceData/cache'):
+    """Load a cleaned source frame from the cache, rebuilding it when the source file or the
+    cleaningVersion changed
+
+    Parameters:
+    name: str - source name, see ingestCleanSource
+    path: str - csv location
+    cacheDir?: str - directory holding the parquet files and their manifests
+
+    Returns:
+    df: pd.DataFrame - cleaned data
+    """
+    if (not pyarrowAvailable):
+        return ingestCleanSource(name, path)
+
+    manifestPath = os.path.join(cacheDir, name + '.json')
+    manifest = {}
+    if (os.path.exists(manifestPath)):
+        with open(manifestPath) as f:
+            manifest = json.load(f)
+        cachePath = os.path.join(cacheDir, manifest.get('file', ''))
+        if (manifest.get('source') == path and manifest.get('cleaningVersion') == cleaningVersion
+                and os.path.exists(cachePath) and fingerprintMatches(path, manifest.get('fingerprint', {}))):
+            print('Loaded cached {0} data from {1}'.format(name, cachePath))
+            return readCachedFrame(cachePath)
+
+    df = ingestCleanSource(name, path)
+
+    fingerprint = getFileFingerprint(path)
+    fileName = '{0}-{1}.parquet'.format(name, fingerprint['sha256'][:16])
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        writeCachedFrame(df, os.path.join(cacheDir, fileName))
+        with open(manifestPath, 'w') as f:
+            json.dump({'source': path, 'fingerprint': fingerprint,
+                      'cleaningVersion': cleaningVersion, 'file': fileName}, f)
+        # drop the stale parquet file of the previous source version
+        staleFile = manifest.get('file')
+        if (staleFile and staleFile != fileName and os.path.exists(os.path.join(cacheDir, staleFile))):
+            os.remove(os.path.join(cacheDir, staleFile))
+    except Exception as err:
+        print('Could not cache {0} data: {1}'.format(name, err))
+    else:
+        print('Cached cleaned {0} data to {1}/{2}'.format(name, cacheDir, fileName))
+
+    return df
+
+
+def loadCleanedSources(useCache: bool = True, sources: dict = None, skip: list = None):
+    """Ingest and clean the drought, county, state, and rain sources
+
+    Parameters:
+    useCache?: bool - read/write the parquet cache (requires pyarrow), default True
+    sources?: dict - source name -> csv path, default sourceFiles
+    skip?: list - source names not loaded, e.g. the drought and rain sources the streaming
+        engine reads chunk by chunk
+
+    Returns:
+    dfDrought, dfCounties, dfStates, dfRain: pd.DataFrame, None for skipped sources
+    """
+    sources = sources or sourceFiles
+    if (useCache and not pyarrowAvailable):
+        print('pyarrow not installed, source cache disabled')
+
+    frames = {}
+    for name in ['drought', 'counties', 'states', 'rain']:
+        if (name in (skip or [])):
+            frames[name] = None
+        elif (useCache):
+            frames[name] = loadCleanedSource(name, sources[name])
+        else:
+            frames[name] = ingestCleanSource(name, sources[name])
+
+    return frames['drought'], frames['counties'], frames['states'], frames['rain']
@@ -1,45 +1,75 @@
 # Used to clean the drought data, county data, and state data
 from datetime import date
+import io
 import json
+import time
 import pandas as pd
 import numpy as np
 
 from pandas.core.frame import DataFrame
-from databaseConnection import getDatabaseConnection
+from psycopg2.extras import execute_values
+from databaseConnection import pooledConnection
+from instrumentation import instrumented
+from dataTypes import monthColumns, compactSchema, compactDtypes
 from createTables import createDroughtTable, createCountiesTable, createStatesTable, createRainTable
 
 
-def cleanRainfallData(df: pd.DataFrame):
-    i = 0
-    data = {'state_id': [], 'county_id': [], 'year': [],
-            'jan': [], 'feb': [], 'mar': [], 'apr': [], 'may': [], 'jun': [],
-            'jul': [], 'aug': [], 'sep': [], 'oct': [], 'nov': [], 'dec': []}
-    for row in df.itertuples(index=False):
-        if (len(row[0]) == 11):
-            idState = row[0][:2]
-            idCounty = row[0][2:5]
-            idRain = row[0][5:7]
-            idYear = row[0][7:]
-            if (idRain == '01'):
-                data['state_id'].append(idState)
-                data['county_id'].append(idCounty)
-                data['year'].append(idYear)
-                data['jan'].append(row[1])
-                data['feb'].append(row[2])
-                data['mar'].append(row[3])
-                data['apr'].append(row[4])
-                data['may'].append(row[5])
-                data['jun'].append(row[6])
-                data['jul'].append(row[7])
-                data['aug'].append(row[8])
-                data['sep'].append(row[9])
-                data['oct'].append(row[10])
-                data['nov'].append(row[11])
-                data['dec'].append(row[12])
-                i += 1
-    if (len(df) == i):
+# NOAA climdiv element codes found in characters 6-7 of the id_code
+climdivElements = {'01': 'precip', '02': 'tavg', '05': 'pdsi', '06': 'phdi',
+                   '07': 'zndx', '08': 'pmdi', '25': 'hddc', '26': 'cddc',
+                   '27': 'tmax', '28': 'tmin'}
+
+
+def parseClimdivData(df: pd.DataFrame, elementCodes: list = None):
+    """Split the 11 character NOAA id_code into state, county, element, and year columns
+
+    id_code layout: state (2) county (3) element (2) year (4), followed by 12 monthly values
+
+    Parameters:
+    df: pd.DataFrame - climdiv data with id_code as the first column and jan..dec after it
+    elementCodes?: list - element codes to return (see climdivElements), default all present
+
+    Returns:
+    elements: dict - element code -> pd.DataFrame state_id, county_id, year, jan..dec
+    """
+    ids = df.iloc[:, 0]
+    validIds = ids.str.len() == 11
+    ids = ids[validIds]
+
+    dfParsed = pd.DataFrame({'state_id': ids.str.slice(0, 2),
+                             'county_id': ids.str.slice(2, 5),
+                             'element': ids.str.slice(5, 7),
+                             'year': ids.str.slice(7, 11)})
+    monthValues = df.loc[validIds].iloc[:, 1:13]
+    monthValues.columns = monthColumns
+    dfParsed = pd.concat([dfParsed, monthValues], axis=1)
+
+    if (elementCodes == None):
+        elementCodes = dfParsed['element'].unique()
+
+    elements = {}
+    for code, dfElement in dfParsed.groupby('element', sort=False):
+        if (code in elementCodes):
+            elements[code] = dfElement.drop(
+                columns=['element']).reset_index(drop=True)
+    return elements
+
+
+def cleanRainfallData(df: pd.DataFrame, elementCode: str = '01'):
+    """Clean rainfall data parses the climdiv id_code and keeps the precipitation rows
+
+    Parameters:
+    df: pd.DataFrame - climdiv source data
+    elementCode?: str - climdiv element to keep, default '01' precipitation
+
+    Returns:
+    newDf: pd.DataFrame - state_id, county_id, year, jan..dec
+    """
+    elements = parseClimdivData(df, [elementCode])
+    newDf = elements.get(elementCode, pd.DataFrame(
+        columns=['state_id', 'county_id', 'year'] + monthColumns))
+    if (len(df) == len(newDf)):
         print('All rows IDs are valid length')
-    newDf = pd.DataFrame(data)
     return newDf
 
 
@@ -80,6 +110,7 @@ def insertAmtEqualsSource(dfLen: int, dbTblLen: int):
         return False
 
 
+@instrumented(category='clean')
 def cleanFipsCols(df: pd.DataFrame, column: str, lenCol: int):
     """Clean fips col edits the fips codes to ensure all are lenCol digits long
     Adds leading zeros when needed
@@ -95,235 +126,201 @@ def cleanFipsCols(df: pd.DataFrame, column: str, lenCol: int):
     return df
 
 
-def insertIntoRain(dataFrame: pd.DataFrame):
-    """Insert rain data into the database
+def copyIntoTable(cur, dataFrame: pd.DataFrame, tableName: str, columns: list):
+    """Stream a dataframe into a table with COPY ... FROM STDIN, nothing is commited
 
     Parameters:
-    dataFrame: pd.DataFrame
+    cur: psycopg2 cursor
+    dataFrame: pd.DataFrame - rows to copy, columns in the same order as columns
+    tableName: str - destination table
+    columns: list - destination column names
+    """
+    buffer = io.StringIO()
+    dataFrame.to_csv(buffer, index=False, header=False, na_rep='NaN')
+    buffer.seek(0)
+    cur.copy_expert("COPY {0} ({1}) FROM STDIN WITH (FORMAT csv);".format(
+        tableName, ', '.join(columns)), buffer)
+
+
+def readTable(sql: str, dtype: dict = None):
+    """Read a query result into a dataframe through COPY ... TO STDOUT
+
+    Parameters:
+    sql: str - SELECT statement
+    dtype?: dict - column dtypes for read_csv, fips columns should be str
 
     Returns:
-    bool - data was inserted and commited to db successfully
+    df: pd.DataFrame - query result, None when the query fails
     """
-    conn = getDatabaseConnection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM rain LIMIT 3;")
-    if (cur.fetchone() == None):
-        totalRows = len(dataFrame.index)
-        currentRow = 0
-        print('Starting Rain Insert into Database...')
+    with pooledConnection() as conn:
+        if (conn == None):
+            return None
+        cur = conn.cursor()
+        buffer = io.StringIO()
         try:
-            for row in dataFrame.itertuples(index=False):
-                currentRow += 1
-                percentage = (currentRow / totalRows) * 100
-                if (percentage % 5 == 0):
-                    print('{0}% complete'.format(percentage))
-                sql = cur.mogrify("INSERT INTO rain (state_id, county_id, year, jan, feb, mar, apr, may, jun, jul, aug, sep, oct, nov, dec) VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);",
-                                  (row.state_id, row.county_id, row.year, row.jan, row.feb, row.mar, row.apr, row.may, row.jun, row.jul, row.aug, row.sep, row.oct, row.nov, row.dec))
-                cur.execute(sql)
+            cur.copy_expert(
+                "COPY ({0}) TO STDOUT WITH (FORMAT csv, HEADER);".format(sql), buffer)
         except Exception as err:
             print(err)
+            return None
+        finally:
             cur.close()
-            conn.close()
-            return False
-        else:
-            # only commit the data to DB if there is no loss of data from source
-            if (insertAmtEqualsSource(totalRows, currentRow)):
-                conn.commit()
-                return True
-            else:
-                print(
-                    'RAIN DATA NOT COMMITED TO DB! Row counts do not match source data')
-                return False
-    else:
-        cur.close()
-        conn.close()
-        return False
+        buffer.seek(0)
+        return pd.read_csv(buffer, dtype=dtype)
 
 
-def insertIntoPdsiPrecip(dataFrame: pd.DataFrame):
-    """Insert pdsiPrecip data into the database
+def bulkInsert(dataFrame: pd.DataFrame, tableName: str, columns: list, label: str,
+               method: str = 'copy', pageSize: int = 10000):
+    """Bulk load a dataframe into an empty table in one transaction
+
+    Streams the rows through COPY ... FROM STDIN from an in-memory csv buffer,
+    falling back to batched execute_values INSERTs if COPY fails or is not requested.
+    Data is only commited when the table row count matches the source row count.
 
     Parameters:
-    dataFrame: pd.DataFrame
+    dataFrame: pd.DataFrame - rows to insert, columns in the same order as columns
+    tableName: str - destination table
+    columns: list - destination column names
+    label: str - name used in progress messages
+    method?: str - 'copy' (default) or 'values' for execute_values batching
+    pageSize?: int - rows per execute_values statement
 
     Returns:
     bool - data was inserted and commited to db successfully
     """
-    conn = getDatabaseConnection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM pdsi_precip LIMIT 3;")
-    if (cur.fetchone() == None):
+    with pooledConnection() as conn:
+        if (conn == None):
+            return False
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM {0} LIMIT 3;".format(tableName))
+        if (cur.fetchone() != None):
+            print('{0} table already contains data, skipping insert'.format(label))
+            cur.close()
+            return False
+
         totalRows = len(dataFrame.index)
-        currentRow = 0
-        print('Starting PDSI Precip Insert into Database...')
+        columnList = ', '.join(columns)
+        print('Starting {0} Insert into Database...'.format(label))
+        start = time.perf_counter()
         try:
-            for row in dataFrame.itertuples(index=False):
-                currentRow += 1
-                percentage = (currentRow / totalRows) * 100
-                if (percentage % 5 == 0):
-                    print('{0}% complete'.format(percentage))
-                sql = cur.mogrify("INSERT INTO pdsi_precip (year, month, county_fips, pdsi, precip, state_fips) VALUES(%s, %s, %s, %s, %s, %s);",
-                                  (row.year, row.month, row.county_fips, row.pdsi, row.rainfall, row.state_fips))
-                cur.execute(sql)
+            if (method == 'copy'):
+                try:
+                    copyIntoTable(cur, dataFrame, tableName, columns)
+                except Exception as err:
+                    print('COPY into {0} failed, falling back to batched INSERTs: {1}'.format(
+                        tableName, err))
+                    conn.rollback()
+                    method = 'values'
+            if (method == 'values'):
+                execute_values(cur, "INSERT INTO {0} ({1}) VALUES %s;".format(tableName, columnList),
+                               dataFrame.itertuples(index=False, name=None), page_size=pageSize)
+            cur.execute("SELECT count(*) FROM {0};".format(tableName))
+            dbRows = cur.fetchone()[0]
         except Exception as err:
             print(err)
+            conn.rollback()
             cur.close()
-            conn.close()
             return False
+
+        elapsed = time.perf_counter() - start
+        # only commit the data to DB if there is no loss of data from source
+        if (insertAmtEqualsSource(totalRows, dbRows)):
+            conn.commit()
+            print('{0} rows inserted in {1:.2f}s ({2:.0f} rows/s)'.format(
+                totalRows, elapsed, totalRows / elapsed if elapsed else float(totalRows)))
+            cur.close()
+            return True
         else:
-            # only commit the data to DB if there is no loss of data from source
-            if (insertAmtEqualsSource(totalRows, currentRow)):
-                conn.commit()
-                return True
-            else:
-                print(
-                    'PDSI PRECIP DATA NOT COMMITED TO DB! Row counts do not match source data')
-                return False
-    else:
-        cur.close()
-        conn.close()
-        return False
+            print('{0} DATA NOT COMMITED TO DB! Row counts do not match source data'.format(
+                label.upper()))
+            conn.rollback()
+            cur.close()
+            return False
+
+
+@instrumented(category='insert')
+def insertIntoRain(dataFrame: pd.DataFrame, method: str = 'copy'):
+    """Insert rain data into the database
+
+    Parameters:
+    dataFrame: pd.DataFrame
+    method?: str - 'copy' or 'values', see bulkInsert
+
+    Returns:
+    bool - data was inserted and commited to db successfully
+    """
+    columns = ['state_id', 'county_id', 'year', 'jan', 'feb', 'mar', 'apr',
+               'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+    return bulkInsert(dataFrame[columns], 'rain', columns, 'Rain', method)
+
 
+@instrumented(category='insert')
+def insertIntoPdsiPrecip(dataFrame: pd.DataFrame, method: str = 'copy'):
+    """Insert pdsiPrecip data into the database
+
+    Parameters:
+    dataFrame: pd.DataFrame
+    method?: str - 'copy' or 'values', see bulkInsert
+
+    Returns:
+    bool - data was inserted and commited to db successfully
+    """
+    return bulkInsert(dataFrame[['year', 'month', 'county_fips', 'pdsi', 'rainfall', 'state_fips']],
+                      'pdsi_precip', ['year', 'month', 'county_fips', 'pdsi', 'precip', 'state_fips'],
+                      'PDSI Precip', method)
 
-def insertIntoDrought(dataFrame: pd.DataFrame):
+
+@instrumented(category='insert')
+def insertIntoDrought(dataFrame: pd.DataFrame, method: str = 'copy'):
     """Insert drought data into the database
 
     Parameters:
     dataFrame: pd.DataFrame
+    method?: str - 'copy' or 'values', see bulkInsert
 
     Returns:
     bool - data was inserted and commited to db successfully
     """
-    conn = getDatabaseConnection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM drought LIMIT 3;")
-    if (cur.fetchone() == None):
-        totalRows = len(dataFrame.index)
-        currentRow = 0
-        print('Starting Drought Insert into Database...')
-        try:
-            for row in dataFrame.itertuples(index=False):
-                currentRow += 1
-                percentage = (currentRow / totalRows) * 100
-                if (percentage % 5 == 0):
-                    print('{0}% complete'.format(percentage))
-                sql = cur.mogrify("INSERT INTO drought (year, month, state_fips, county_fips, pdsi) VALUES(%s, %s, %s, %s, %s);",
-                                  (row.year, row.month, row.statefips, row.countyfips, row.pdsi))
-                cur.execute(sql)
-        except Exception as err:
-            print(err)
-            cur.close()
-            conn.close()
-            return False
-        else:
-            # only commit the data to DB if there is no loss of data from source
-            if (insertAmtEqualsSource(totalRows, currentRow)):
-                conn.commit()
-                return True
-            else:
-                print(
-                    'DROUGHT DATA NOT COMMITED TO DB! Row counts do not match source data')
-                return False
-    else:
-        cur.close()
-        conn.close()
-        return False
+    return bulkInsert(dataFrame[['year', 'month', 'statefips', 'countyfips', 'pdsi']],
+                      'drought', ['year', 'month', 'state_fips', 'county_fips', 'pdsi'],
+                      'Drought', method)
 
 
-def insertIntoStates(dataFrame: pd.DataFrame):
+@instrumented(category='insert')
+def insertIntoStates(dataFrame: pd.DataFrame, method: str = 'copy'):
     """Insert state data into the database
 
     Parameters:
     dataFrame: pd.DataFrame
+    method?: str - 'copy' or 'values', see bulkInsert
 
     Returns:
     bool - data was inserted and commited to db successfully
     """
-    conn = getDatabaseConnection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM states LIMIT 3;")
-    if (cur.fetchone() == None):
-        totalRows = len(dataFrame.index)
-        currentRow = 0
-        print('Starting States Insert into Database...')
-        try:
-            for row in dataFrame.itertuples(index=False):
-                currentRow += 1
-                percentage = (currentRow / totalRows) * 100
-                if (percentage % 5 == 0):
-                    print('{0}% complete'.format(percentage))
-                sql = cur.mogrify("INSERT INTO states (name, postal_code, fips, noaa_code) VALUES(%s, %s, %s, %s);",
-                                  (row[0], row[1], row[2], row[3]))
-                cur.execute(sql)
-        except Exception as err:
-            print(err)
-            cur.close()
-            conn.close()
-            return False
-        else:
-            # only commit the data to DB if there is no loss of data from source
-            if (insertAmtEqualsSource(totalRows, currentRow)):
-                conn.commit()
-                return True
-            else:
-                print(
-                    'STATES DATA NOT COMMITED TO DB! Row counts do not match source data')
-                return False
-    else:
-        cur.close()
-        conn.close()
-        return False
+    return bulkInsert(dataFrame.iloc[:, 0:4], 'states',
+                      ['name', 'postal_code', 'fips', 'noaa_code'], 'States', method)
 
 
-def insertIntoCounties(dataFrame: pd.DataFrame):
+@instrumented(category='insert')
+def insertIntoCounties(dataFrame: pd.DataFrame, method: str = 'copy'):
     """Insert county data into the database
 
     Parameters:
     dataFrame: pd.DataFrame
+    method?: str - 'copy' or 'values', see bulkInsert
 
     Returns:
     bool - data was inserted and commited to db successfully
     """
-    conn = getDatabaseConnection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM counties LIMIT 3;")
-    if (cur.fetchone() == None):
-        totalRows = len(dataFrame.index)
-        currentRow = 0
-        print('Starting Counties Insert into Database...')
-        try:
-            for row in dataFrame.itertuples(index=False):
-                currentRow += 1
-                percentage = (currentRow / totalRows) * 100
-                if (percentage % 5 == 0):
-                    print('{0}% complete'.format(percentage))
-                sql = cur.mogrify("INSERT INTO counties (fips, name, fips_only) VALUES(%s, %s, %s);",
-                                  (row.county_fips, row.county_name, row.fips_only))
-                cur.execute(sql)
-        except Exception as err:
-            print(err)
-            cur.close()
-            conn.close()
-            return False
-        else:
-            # only commit the data to DB if there is no loss of data from source
-            if (insertAmtEqualsSource(totalRows, currentRow)):
-                conn.commit()
-                return True
-            else:
-                print(
-                    'COUNTIES DATA NOT COMMITED TO DB! Row counts do not match source data')
-                return False
-    else:
-        cur.close()
-        conn.close()
-        return False
+    return bulkInsert(dataFrame[['county_fips', 'county_name', 'fips_only']],
+                      'counties', ['fips', 'name', 'fips_only'], 'Counties', method)
 
 
 def insertIntoMissingCounties(countyFips: np.array):
     pass
 
 
+@instrumented(category='insert')
 def insertMissingCounties():
     """Insert missing counties manually inserts the two missing counties from the county data
 
@@ -331,50 +328,80 @@ def insertMissingCounties():
 
     Returns: None
     """
-    conn = getDatabaseConnection()
-    cur = conn.cursor()
+    with pooledConnection() as conn:
+        cur = conn.cursor()
+
+        """
+        https://www.ddorn.net/data/FIPS_County_Code_Changes.pdf
+        Colorado, 2001: Broomfield county (FIPS 8014) is created out of parts of Adams, Boulder, Jefferson, and Weld counties.
+        The Census Bureau estimates that the resulting population
+        loss was 21,512 for Boulder, 15,870 for Adams, 1,726 for Jefferson, and 69 for Weld county. (Dorn)
+        """
+        cur.execute("SELECT name FROM counties WHERE fips='08014';")
+        if (cur.fetchone() == None):
+            cur.execute(
+                "INSERT INTO counties (fips, name, fips_only) VALUES('08014', 'Broomfield County', '014');")
+
+        """
+        https://www.ddorn.net/data/FIPS_County_Code_Changes.pdf
+        Florida, 1997: Dade county (FIPS 12025) is renamed as Miami-Dade county (FIPS 12086).
+        """
+        cur.execute("SELECT name FROM counties WHERE fips='12086';")
+        if (cur.fetchone() == None):
+            cur.execute(
+                "INSERT INTO counties (fips, name, fips_only) VALUES('12086', 'Miami-Dade County', '086');")
+
+        """
+        South Dakota, 2015: Shannon County (FIPS 46113) is renamed to Oglala Lakota County (FIPS 46102).
+        Action: replace FIPS code 46102 with the old code 46113.
+        """
+        if (cur.fetchone() == None):
+            cur.execute(
+                "INSERT INTO counties (fips, name, fips_only) VALUES('46102', 'Oglala Lakota County', '102');"
+            )
+
+        conn.commit()
+        cur.close()
 
-    """
-    https://www.ddorn.net/data/FIPS_County_Code_Changes.pdf
-    Colorado, 2001: Broomfield county (FIPS 8014) is created out of parts of Adams, Boulder, Jefferson, and Weld counties.
-    The Census Bureau estimates that the resulting population
-    loss was 21,512 for Boulder, 15,870 for Adams, 1,726 for Jefferson, and 69 for Weld county. (Dorn)
-    """
-    cur.execute("SELECT name FROM counties WHERE fips='08014';")
-    if (cur.fetchone() == None):
-        cur.execute(
-            "INSERT INTO counties (fips, name, fips_only) VALUES('08014', 'Broomfield County', '014');")
 
-    """
-    https://www.ddorn.net/data/FIPS_County_Code_Changes.pdf
-    Florida, 1997: Dade county (FIPS 12025) is renamed as Miami-Dade county (FIPS 12086).
-    """
-    cur.execute("SELECT name FROM counties WHERE fips='12086';")
-    if (cur.fetchone() == None):
-        cur.execute(
-            "INSERT INTO counties (fips, name, fips_only) VALUES('12086', 'Miami-Dade County', '086');")
+def fipsKeyCounts(keys: pd.Series):
+    """Count every fips key once with a hashed value_counts, missing keys included
 
+    Parameters:
+    keys: pd.Series - fips column
+
+    Returns:
+    counts: pd.Series - key -> rows
     """
-    South Dakota, 2015: Shannon County (FIPS 46113) is renamed to Oglala Lakota County (FIPS 46102).
-    Action: replace FIPS code 46102 with the old code 46113.
-    """
-    if (cur.fetchone() == None):
-        cur.execute(
-            "INSERT INTO counties (fips, name, fips_only) VALUES('46102', 'Oglala Lakota County', '102');"
-        )
+    return keys.value_counts(dropna=False, sort=False)
+
+
+def joinedRowCount(leftCounts: pd.Series, rightCounts: pd.Series):
+    """Rows a left join on these keys would produce, without building it
+
+    Every left row is kept once, or once per matching right row
+
+    Parameters:
+    leftCounts: pd.Series - key -> rows of the left table, see fipsKeyCounts
+    rightCounts: pd.Series - key -> rows of the right table
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    Returns:
+    int - joined row count
+    """
+    matches = rightCounts.reindex(leftCounts.index).fillna(0).clip(lower=1)
+    return int((leftCounts * matches).sum())
 
 
-def getMissingStates(states: pd.DataFrame, drought: pd.DataFrame):
+def getMissingStates(states: pd.DataFrame, drought: pd.DataFrame, droughtKeys: pd.Index = None,
+                     verbose: bool = True):
     """Checks states that do not have a match to the drought data
     These are the states that we have, but are not in the data
 
     Parameters:
     states: DataFrame
     drought: DataFrame
+    droughtKeys?: pd.Index - unique drought statefips when already computed
+    verbose?: bool - print the missing states
 
     Returns:
     missingStates[state_fips]: np.array
@@ -382,26 +409,28 @@ def getMissingStates(states: pd.DataFrame, drought: pd.DataFrame):
     Equivalent SQL query:
     SELECT a.name FROM states a LEFT OUTER JOIN drought b ON(a.fips = b.state_fips) WHERE b.year IS NULL;
     """
-    missingStates = np.array
-
-    leftJoin = states.merge(drought, how='left', left_on=[
-                            'state_fips'], right_on=['statefips'])
-    naRows = leftJoin[leftJoin['year'].isna()]
-    print('Known States Not Found {0} (Expected 7)========================'.format(
-        len(naRows)))
-    print(naRows['state_name'])
+    if (droughtKeys is None):
+        droughtKeys = pd.Index(drought['statefips'].unique())
+    naRows = states.loc[~states['state_fips'].isin(droughtKeys)]
+    if (verbose):
+        print('Known States Not Found {0} (Expected 7)========================'.format(
+            len(naRows)))
+        print(naRows['state_name'])
     missingStates = naRows['state_fips'].values
 
     return missingStates
 
 
-def getMissingCounties(counties: pd.DataFrame, drought: pd.DataFrame):
+def getMissingCounties(counties: pd.DataFrame, drought: pd.DataFrame, droughtKeys: pd.Index = None,
+                       verbose: bool = True):
     """Checks counties that do not have a match to the drought data
     These are the counties that we have, but are not in the data
 
     Parameters:
     counties: DataFrame
     drought: DataFrame
+    droughtKeys?: pd.Index - unique drought countyfips when already computed
+    verbose?: bool - print the missing counties
 
     Returns:
     missingCounties[county_fips]: np.array
@@ -409,55 +438,75 @@ def getMissingCounties(counties: pd.DataFrame, drought: pd.DataFrame):
     Equivalent SQL query:
     SELECT a.name FROM counties a LEFT OUTER JOIN drought b ON(a.fips = b.county_fips) WHERE b.year IS NULL;
     """
-    missingCounties = np.array
-
-    leftJoin = counties.merge(drought, how='left', left_on=[
-        'county_fips'], right_on=['countyfips'])
-    naRows = leftJoin[leftJoin['year'].isna()]
-    print('Known Counties Not Found {0} (Expected 88)========================'.format(
-        len(naRows)))
-    print(naRows['county_name'])
+    if (droughtKeys is None):
+        droughtKeys = pd.Index(drought['countyfips'].unique())
+    naRows = counties.loc[~counties['county_fips'].isin(droughtKeys)]
+    if (verbose):
+        print('Known Counties Not Found {0} (Expected 88)========================'.format(
+            len(naRows)))
+        print(naRows['county_name'])
     missingCounties = naRows['county_fips'].values
 
     return missingCounties
 
 
-def cleanFips(drought: pd.DataFrame, counties: pd.DataFrame, states: pd.DataFrame):
+def cleanFips(drought: pd.DataFrame, counties: pd.DataFrame, states: pd.DataFrame,
+              verbose: bool = True):
     """cleanFips main method for checking fips data for successful joining
 
+    The drought fips columns are counted once into hashed key sets, the missing keys of
+    each table and the row deltas of the state and county left joins come from those
+    sets without materializing the joined frames
+
     Parameters:
     drought: pd.DataFrame - drought source dataframe
     counties: pd.DataFrame - county source dataframe
     states: pd.DataFrame - state source dataframe
+    verbose?: bool - print the findings, off for state partitions whose errors are summed
+        by the caller (missing states and counties only make sense for the whole frame)
 
     Returns:
-    doesNotInclude: dict - states, counties, stateErrors, countyErrors
+    doesNotInclude: dict - states, counties, stateErrors, countyErrors,
+        unmatchedStates, unmatchedCounties (drought keys missing from states/counties)
     """
-    droughtRows = len(drought.index)
-    missingStates = getMissingStates(states, drought)
-    missingCounties = getMissingCounties(counties, drought)
+    droughtStateCounts = fipsKeyCounts(drought['statefips'])
+    droughtCountyCounts = fipsKeyCounts(drought['countyfips'])
+    stateCounts = fipsKeyCounts(states['state_fips'])
+    countyCounts = fipsKeyCounts(counties['county_fips'])
+
+    missingStates = getMissingStates(states, drought, droughtStateCounts.index, verbose)
+    missingCounties = getMissingCounties(counties, drought, droughtCountyCounts.index, verbose)
 
-    droughtStatesJoin = drought.merge(
-        states, how='left', left_on='statefips', right_on='state_fips')
-    stateErrors = droughtRows - len(droughtStatesJoin.index)
+    droughtRows = len(drought.index)
+    stateErrors = droughtRows - \
+        joinedRowCount(droughtStateCounts, stateCounts)
+    countyErrors = droughtRows - \
+        joinedRowCount(droughtCountyCounts, countyCounts)
 
-    droughtCountiesJoin = drought.merge(
-        counties, how='left', left_on='countyfips', right_on='county_fips')
-    countyErrors = droughtRows - len(droughtCountiesJoin.index)
+    unmatchedStates = droughtStateCounts.index[~droughtStateCounts.index.isin(stateCounts.index)]
+    unmatchedCounties = droughtCountyCounts.index[~droughtCountyCounts.index.isin(countyCounts.index)]
 
     doesNotInclude = {
         'states': missingStates,
         'counties': missingCounties,
         'stateErrors': stateErrors,
-        'countyErrors': countyErrors
+        'countyErrors': countyErrors,
+        'unmatchedStates': unmatchedStates.values,
+        'unmatchedCounties': unmatchedCounties.values
     }
 
-    print('Invalid states: {0}'.format(stateErrors))
-    print('Invalid counties: {0}'.format(countyErrors))
+    if (verbose):
+        print('Invalid states: {0}'.format(stateErrors))
+        print('Invalid counties: {0}'.format(countyErrors))
+        print('Drought states not in states: {0} ({1} rows)'.format(
+            len(unmatchedStates), int(droughtStateCounts[unmatchedStates].sum())))
+        print('Drought counties not in counties: {0} ({1} rows)'.format(
+            len(unmatchedCounties), int(droughtCountyCounts[unmatchedCounties].sum())))
 
     return doesNotInclude
 
 
+@instrumented(category='ingest')
 def ingestCSV(path: str = 'sourceData/drought.csv'):
     """IngestCSV pulls in source csv data with pandas
 
@@ -475,4 +524,8 @@ def ingestCSV(path: str = 'sourceData/drought.csv'):
         "noaa_state_fips": str,
         "id_code": str
     })
+    # fips columns stay strings here so cleanFipsCols can pad them
+    numericSchema = {column: dtype for column, dtype in compactSchema.items()
+                     if dtype != 'category'}
+    dfIngest = compactDtypes(dfIngest, path, numericSchema, downcastFloats=True)
     return dfIngest
@@ -0,0 +1,77 @@
+# Compact dtypes for the drought, rain, and combined data frames
+import pandas as pd
+
+
+monthColumns = ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+                'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# print a memory report for every labeled compactDtypes call, see setMemoryReports
+memoryReports = False
+
+# column name -> compact dtype, columns not present in a frame are ignored
+# float32 keeps about 7 significant digits, enough for the 2 decimal NOAA measurements;
+# aggregation.getAverageAnnual widens them back to float64 before averaging
+compactSchema = {
+    'year': 'int16',
+    'month': 'int8',
+    'pdsi': 'float32',
+    'rainfall': 'float32',
+    'pdsiAvg': 'float32',
+    'precipAvg': 'float32',
+    'county_fips': 'category',
+    'state_fips': 'category',
+    'countyFips': 'category',
+    'stateFips': 'category',
+    **{month: 'float32' for month in monthColumns}
+}
+
+
+def getMemoryUsageMB(df: pd.DataFrame):
+    """Get the deep memory usage of a dataframe in MB
+
+    Parameters:
+    df: pd.DataFrame
+
+    Returns:
+    float - memory usage in MB
+    """
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def setMemoryReports(enabled: bool):
+    """Turn the before and after memory reports of compactDtypes on or off"""
+    global memoryReports
+    memoryReports = enabled
+
+
+def compactDtypes(df: pd.DataFrame, label: str = None, schema: dict = None, downcastFloats: bool = False):
+    """Convert columns to compact dtypes
+    fips codes -> category, year -> int16, month -> int8, measurements -> float32
+
+    Parameters:
+    df: pd.DataFrame - frame to convert
+    label?: str - name of the before and after memory report, printed when memoryReports is on
+    schema?: dict - column -> dtype, default compactSchema
+    downcastFloats?: bool - also convert any other float64 column to float32
+
+    Returns:
+    df: pd.DataFrame - converted frame
+    """
+    schema = schema or compactSchema
+    report = label and memoryReports
+    if (report):
+        memoryBefore = getMemoryUsageMB(df)
+
+    conversions = {column: dtype for column, dtype in schema.items()
+                   if column in df.columns and df[column].dtype != dtype}
+    if (downcastFloats):
+        for column in df.columns:
+            if (column not in schema and df[column].dtype == 'float64'):
+                conversions[column] = 'float32'
+    if (conversions):
+        df = df.astype(conversions)
+
+    if (report):
+        print('{0} memory: {1:.1f} MB -> {2:.1f} MB'.format(
+            label, memoryBefore, getMemoryUsageMB(df)))
+    return df
@@ -1,4 +1,13 @@
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import pool
+
+
+# shared pool reused by the create, insert, and query stages, see getConnectionPool
+connectionPool = None
+poolSettings = {'dbName': 'capstone', 'user': 'punchcard',
+                'minConn': 1, 'maxConn': 4}
 
 
 def getDatabaseConnection(dbName='capstone', user='punchcard'):
@@ -19,6 +28,122 @@ def getDatabaseConnection(dbName='capstone', user='punchcard'):
         return conn
 
 
+def configureConnectionPool(dbName='capstone', user='punchcard', minConn=1, maxConn=4):
+    """Set the database and size of the connection pool, closing any open pool
+
+    Parameters:
+    dbName (string): database name
+    user (string): username for database
+    minConn (int): connections opened up front
+    maxConn (int): most connections open at once
+
+    Returns: None
+    """
+    closeConnectionPool()
+    poolSettings.update({'dbName': dbName, 'user': user,
+                        'minConn': minConn, 'maxConn': maxConn})
+
+
+def getConnectionPool():
+    """Get the shared connection pool, opening it on first use
+
+    Parameters: None
+
+    Returns: psycopg2 ThreadedConnectionPool, None when the database is unreachable
+    """
+    global connectionPool
+    if (connectionPool == None):
+        try:
+            connectionPool = pool.ThreadedConnectionPool(
+                poolSettings['minConn'], poolSettings['maxConn'],
+                "dbname={0} user={1}".format(poolSettings['dbName'], poolSettings['user']))
+        except Exception as err:
+            print('--- Failed to connect to {0} as {1} ---'.format(
+                poolSettings['dbName'], poolSettings['user']))
+            print(err)
+            return None
+    return connectionPool
+
+
+def closeConnectionPool():
+    """Close every connection of the shared pool
+
+    Parameters: None
+
+    Returns: None
+    """
+    global connectionPool
+    if (connectionPool != None):
+        connectionPool.closeall()
+        connectionPool = None
+
+
+def connectionHealthy(conn):
+    """Check a pooled connection is still usable before handing it out
+
+    Parameters:
+    conn: psycopg2 connection
+
+    Returns:
+    Boolean - connection answered SELECT 1
+    """
+    if (conn.closed):
+        return False
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1;')
+        cur.fetchone()
+        cur.close()
+        conn.rollback()
+    except Exception:
+        return False
+    return True
+
+
+@contextmanager
+def pooledConnection():
+    """Borrow a healthy connection from the shared pool
+
+    Usage:
+    with pooledConnection() as conn:
+        ...
+        conn.commit()
+
+    Work that was not commited is rolled back when the connection goes back to the pool
+
+    Parameters: None
+
+    Yields: psycopg2 connection, None when the database is unreachable
+    """
+    connPool = getConnectionPool()
+    if (connPool == None):
+        yield None
+        return
+
+    conn = None
+    try:
+        for _ in range(poolSettings['maxConn'] + 1):
+            conn = connPool.getconn()
+            if (connectionHealthy(conn)):
+                break
+            connPool.putconn(conn, close=True)
+            conn = None
+    except Exception as err:
+        print('--- Failed to get a pooled connection ---')
+        print(err)
+
+    if (conn == None):
+        yield None
+        return
+
+    try:
+        yield conn
+    finally:
+        if (not conn.closed):
+            conn.rollback()
+        connPool.putconn(conn, close=bool(conn.closed))
+
+
 def databaseConnected():
     """Check if database connection can be established
 
@@ -27,9 +152,5 @@ def databaseConnected():
     Returns:
     Boolean - connected or not
     """
-    conn = getDatabaseConnection()
-    if (conn):
-        conn.close()
-        return True
-    else:
-        return False
+    with pooledConnection() as conn:
+        return conn != None
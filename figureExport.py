@@ -0,0 +1,163 @@
+# Export a plotly figure to several formats from one serialization, writing the files on a thread pool
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from instrumentation import instrumented
+from renderCache import specJsonHash, isUpToDate, recordRender, recordFailure
+
+
+# default directory of every format, same as the exportPlotly* functions
+exportDirs = {'png': 'visualizations/png',
+              'svg': 'visualizations/svg', 'html': 'visualizations/html'}
+# kaleido settings of the image formats, None keeps the kaleido default size
+imageOptions = {'png': {'width': 1024, 'height': 768},
+                'svg': {'width': None, 'height': None}}
+htmlConfig = dict(displayModeBar=False)
+writerThreads = 4
+
+# file writer pool of this process, recreated in forked workers, see getWriterPool
+writerPool = None
+writerPid = None
+pendingWrites = []
+# error text of the exports that failed in this process since the last takeExportErrors
+exportErrors = []
+
+
+def getWriterPool():
+    """Get the file writer thread pool, starting it on the first call in a process"""
+    global writerPool, writerPid
+    if (writerPool == None or writerPid != os.getpid()):
+        # threads do not survive a fork, the pool of the parent is unusable in a worker
+        writerPool = ThreadPoolExecutor(max_workers=writerThreads)
+        writerPid = os.getpid()
+        pendingWrites.clear()
+    return writerPool
+
+
+def getImageScope():
+    """The long lived kaleido scope of plotly, its renderer process is started once per
+    process and reused by every image
+
+    Returns:
+    scope: kaleido PlotlyScope, None when kaleido is not installed
+    """
+    import plotly.io as pio
+    return pio.kaleido.scope
+
+
+def writeArtifact(path: str, content, specHash: str):
+    """Write a rendered figure and record its spec hash, run on the writer pool"""
+    mode = 'w' if isinstance(content, str) else 'wb'
+    try:
+        with open(path, mode, encoding='utf-8' if mode == 'w' else None) as f:
+            f.write(content)
+    except Exception:
+        recordFailure(path)
+        raise
+    recordRender(path, specHash)
+    print('Exported Plotly {0}'.format(path))
+    return path
+
+
+def renderFormat(figDict: dict, fmt: str):
+    """Render a validated figure dict to the content of a file in fmt"""
+    if (fmt == 'html'):
+        import plotly.io as pio
+        # to_html adds its defaults to the config it is given, the shared one must stay as hashed
+        return pio.to_html(figDict, config=dict(htmlConfig), validate=False)
+    scope = getImageScope()
+    if (scope == None):
+        raise ValueError('Image export requires the kaleido package')
+    return scope.transform(figDict, format=fmt, **imageOptions[fmt])
+
+
+def formatOptions(fmt: str):
+    """Export settings of a format that change its output, part of the spec hash"""
+    if (fmt == 'html'):
+        return {'format': 'html', 'config': htmlConfig}
+    return dict({'format': fmt}, **{key: value for key, value
+                                    in imageOptions[fmt].items() if value != None})
+
+
+@instrumented(category='export')
+def exportFigure(figure, fileName: str, formats: list = None, dirs: dict = None):
+    """Export a plotly figure to every requested format
+
+    The figure is validated and serialized once, images are rendered one after another by
+    the shared kaleido scope, and the files are written on the writer pool. Formats with an
+    up to date artifact (see renderCache) are skipped. Call flushExports to wait for the writes.
+
+    Parameters:
+    figure: plotly.graph_objects - plot object
+    fileName: str - name of the export files without extension
+    formats?: list - any of 'png', 'svg', 'html', default ['png']
+    dirs?: dict - format -> export directory, default exportDirs
+
+    Returns:
+    exported: dict - format -> bool, the figure was rendered and queued for writing or up to date,
+        the reason a format failed is kept for takeExportErrors
+    """
+    # plotly is only loaded once a figure is exported, data only runs never import it
+    import plotly.io as pio
+
+    formats = formats or ['png']
+    dirs = dict(exportDirs, **(dirs or {}))
+    figDict = figure.to_dict()
+    specJson = pio.to_json(figDict, validate=False)
+
+    exported = {}
+    for fmt in formats:
+        exportDir = dirs[fmt]
+        if (not os.path.exists(exportDir)):
+            print('Directory "{0} was not found for exporting plot"'.format(exportDir))
+            exportErrors.append('Directory {0} was not found'.format(exportDir))
+            recordFailure(exportDir + '/' + fileName + '.' + fmt)
+            exported[fmt] = False
+            continue
+        path = exportDir + '/' + fileName + '.' + fmt
+        specHash = specJsonHash(specJson, formatOptions(fmt))
+        if (isUpToDate(path, specHash)):
+            print('Up to date Plotly {0}'.format(path))
+            exported[fmt] = True
+            continue
+        try:
+            content = renderFormat(figDict, fmt)
+        except Exception as err:
+            print('Could not export plotly {0}: {1}'.format(fmt, err))
+            exportErrors.append('Could not render {0}: {1!r}'.format(path, err))
+            recordFailure(path)
+            exported[fmt] = False
+        else:
+            pendingWrites.append(getWriterPool().submit(
+                writeArtifact, path, content, specHash))
+            exported[fmt] = True
+    return exported
+
+
+def flushExports():
+    """Wait for the queued file writes
+
+    Returns:
+    failed: int - number of files that could not be written
+    """
+    failed = 0
+    while (pendingWrites):
+        future = pendingWrites.pop(0)
+        try:
+            future.result()
+        except Exception as err:
+            print('Could not write plotly export: {0}'.format(err))
+            exportErrors.append('Could not write plotly export: {0!r}'.format(err))
+            failed += 1
+    return failed
+
+
+def takeExportErrors():
+    """Get and clear the error text of the failed exports, see exportFigure and flushExports
+
+    Returns:
+    errors: list - one message per failed format or file write
+    """
+    errors = list(exportErrors)
+    exportErrors.clear()
+    return errors
@@ -0,0 +1,220 @@
+# Simplified and quantized county geometry for smaller choropleth figures
+import json
+import os
+
+from dataCache import getFileFingerprint
+from dataClean import getGeoData
+
+
+def quantizeRing(ring: list, precision: int):
+    """Round ring coordinates and drop the consecutive duplicates rounding creates
+
+    Parameters:
+    ring: list - closed GeoJSON ring [[lon, lat], ...]
+    precision: int - decimal places kept
+
+    Returns:
+    points: list - (lon, lat) tuples without the closing point
+    """
+    points = []
+    for lon, lat in ring:
+        point = (round(lon, precision), round(lat, precision))
+        if (not points or points[-1] != point):
+            points.append(point)
+    while (len(points) > 1 and points[-1] == points[0]):
+        points.pop()
+    return points
+
+
+def pointSegmentDistance(point: tuple, start: tuple, end: tuple):
+    """Distance from a point to the segment start-end"""
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    if (dx == 0 and dy == 0):
+        return ((point[0] - start[0]) ** 2 + (point[1] - start[1]) ** 2) ** 0.5
+    t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / (dx * dx + dy * dy)
+    t = max(0, min(1, t))
+    x = start[0] + t * dx
+    y = start[1] + t * dy
+    return ((point[0] - x) ** 2 + (point[1] - y) ** 2) ** 0.5
+
+
+def simplifyLine(points: list, tolerance: float):
+    """Douglas-Peucker simplification of an open line, the end points are always kept
+
+    Parameters:
+    points: list - (lon, lat) tuples
+    tolerance: float - max distance in degrees a removed point may be from the line
+
+    Returns:
+    points: list - simplified line
+    """
+    if (len(points) < 3):
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        maxDistance = 0
+        index = first
+        for i in range(first + 1, last):
+            distance = pointSegmentDistance(points[i], points[first], points[last])
+            if (distance > maxDistance):
+                maxDistance = distance
+                index = i
+        if (maxDistance > tolerance):
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplifyArc(points: list, tolerance: float):
+    """Simplify an arc in a canonical direction so both counties sharing it get the same points"""
+    reverse = points[-1] < points[0] or (
+        points[-1] == points[0] and len(points) > 2 and points[-2] < points[1])
+    if (reverse):
+        return simplifyLine(points[::-1], tolerance)[::-1]
+    return simplifyLine(points, tolerance)
+
+
+def iterRings(geometry: dict):
+    """Yield every ring list of a Polygon or MultiPolygon geometry"""
+    if (geometry['type'] == 'Polygon'):
+        polygons = [geometry['coordinates']]
+    elif (geometry['type'] == 'MultiPolygon'):
+        polygons = geometry['coordinates']
+    else:
+        polygons = []
+    for polygon in polygons:
+        for ring in polygon:
+            yield ring
+
+
+def findJunctions(rings: list):
+    """Find the points where a shared border starts or ends
+    Splitting every ring at these points gives TopoJSON style arcs, so a border shared
+    by two counties is simplified the same way in both and no gaps open between them
+
+    Parameters:
+    rings: list - quantized rings from quantizeRing
+
+    Returns:
+    junctions: set - (lon, lat) points
+    """
+    ringsByPoint = {}
+    for ringId, points in enumerate(rings):
+        for point in points:
+            ringsByPoint.setdefault(point, set()).add(ringId)
+
+    junctions = set()
+    for points in rings:
+        for i, point in enumerate(points):
+            sharedBy = ringsByPoint[point]
+            if (len(sharedBy) > 2 or sharedBy != ringsByPoint[points[i - 1]]
+                    or sharedBy != ringsByPoint[points[(i + 1) % len(points)]]):
+                junctions.add(point)
+    return junctions
+
+
+def simplifyRing(points: list, junctions: set, tolerance: float):
+    """Simplify a quantized ring arc by arc between its junctions
+
+    Parameters:
+    points: list - quantized ring without the closing point
+    junctions: set - points from findJunctions
+    tolerance: float - simplification tolerance in degrees
+
+    Returns:
+    ring: list - closed GeoJSON ring [[lon, lat], ...]
+    """
+    anchors = [i for i, point in enumerate(points) if point in junctions]
+    if (not anchors):
+        # ring shares no junction, anchor on its extreme points so an enclave and its
+        # surrounding county still pick the same arcs
+        anchors = sorted({points.index(min(points)), points.index(max(points))})
+
+    simplified = []
+    for n, start in enumerate(anchors):
+        end = anchors[(n + 1) % len(anchors)]
+        if (end > start):
+            arc = points[start:end + 1]
+        else:
+            arc = points[start:] + points[:end + 1]
+        simplified.extend(simplifyArc(arc, tolerance)[:-1])
+
+    # keep the original ring when simplifying would collapse it
+    if (len(simplified) < 3):
+        simplified = points
+    return [list(point) for point in simplified + simplified[:1]]
+
+
+def simplifyGeoData(geoData: dict, tolerance: float = 0.005, precision: int = 3):
+    """Simplify and quantize every county polygon of a GeoJSON FeatureCollection
+
+    Parameters:
+    geoData: dict - GeoJSON FeatureCollection with Polygon and MultiPolygon features
+    tolerance?: float - Douglas-Peucker tolerance in degrees
+    precision?: int - decimal places kept on coordinates
+
+    Returns:
+    simplified: dict - GeoJSON FeatureCollection
+    """
+    rings = []
+    for feature in geoData['features']:
+        for ring in iterRings(feature['geometry']):
+            rings.append(quantizeRing(ring, precision))
+    junctions = findJunctions(rings)
+
+    simplifiedRings = iter([simplifyRing(points, junctions, tolerance)
+                           if len(points) >= 3 else [list(point) for point in points + points[:1]]
+                           for points in rings])
+
+    features = []
+    for feature in geoData['features']:
+        geometry = feature['geometry']
+        if (geometry['type'] == 'Polygon'):
+            coordinates = [next(simplifiedRings) for ring in geometry['coordinates']]
+        elif (geometry['type'] == 'MultiPolygon'):
+            coordinates = [[next(simplifiedRings) for ring in polygon]
+                           for polygon in geometry['coordinates']]
+        else:
+            coordinates = geometry.get('coordinates')
+        features.append({**feature, 'geometry': {'type': geometry['type'],
+                                                 'coordinates': coordinates}})
+
+    return {**geoData, 'features': features}
+
+
+def getSimplifiedGeoData(geoSource: str = 'sourceData/geo.json', tolerance: float = 0.005,
+                         precision: int = 3, cacheDir: str = 'sourceData/cache'):
+    """Load the simplified county GeoJSON, building and caching it on disk on first use
+
+    Parameters:
+    geoSource?: str - full resolution GeoJSON location
+    tolerance?: float - simplification tolerance in degrees
+    precision?: int - decimal places kept on coordinates
+    cacheDir?: str - directory for the simplified file
+
+    Returns:
+    counties: dict - simplified GeoJSON FeatureCollection
+    """
+    sourceHash = getFileFingerprint(geoSource)['sha256'][:16]
+    cachePath = os.path.join(cacheDir, 'geo-{0}-t{1}-p{2}.json'.format(
+        sourceHash, tolerance, precision))
+    if (os.path.exists(cachePath)):
+        return getGeoData(cachePath)
+
+    simplified = simplifyGeoData(getGeoData(geoSource), tolerance, precision)
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        with open(cachePath, 'w') as f:
+            json.dump(simplified, f, separators=(',', ':'))
+    except Exception as err:
+        print('Could not cache simplified geo data: {0}'.format(err))
+    else:
+        print('Simplified geo data {0} -> {1} bytes ({2})'.format(
+            os.path.getsize(geoSource), os.path.getsize(cachePath), cachePath))
+
+    return simplified
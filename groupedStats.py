@@ -0,0 +1,210 @@
+# Grouped statistics computed in one pass over the data for every group
+import numpy as np
+import pandas as pd
+
+
+momentColumns = ['n', 'sx', 'sy', 'sxx', 'syy', 'sxy']
+
+
+def correlationMoments(df: pd.DataFrame, by, x: str = 'pdsi', y: str = 'rainfall', method: str = 'pearson'):
+    """Sums of x, y, x^2, y^2 and xy for each group
+    Rows missing x or y are skipped like DataFrame.corr does. Moments of separate chunks
+    of a group can be added together before calling correlationFromMoments
+
+    Parameters:
+    df: pd.DataFrame - data holding the by, x and y columns
+    by: str | list - grouping columns, e.g. 'year', 'state_fips' or 'county_fips'
+    x?: str - first variable
+    y?: str - second variable
+    method?: str - 'pearson' or 'spearman' (sums of the ranks within each group)
+
+    Returns:
+    dfMoments: pd.DataFrame - n, sx, sy, sxx, syy, sxy indexed by the group columns
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    dfPairs = df.loc[df[x].notna() & df[y].notna(), by + [x, y]]
+    xValues = dfPairs[x].to_numpy(dtype='float64')
+    yValues = dfPairs[y].to_numpy(dtype='float64')
+    if (method == 'spearman'):
+        grouped = pd.DataFrame({'x': xValues, 'y': yValues}, index=dfPairs.index).groupby(
+            [dfPairs[column] for column in by], sort=False, observed=True)
+        xValues = grouped['x'].rank(method='average').to_numpy()
+        yValues = grouped['y'].rank(method='average').to_numpy()
+    elif (method != 'pearson'):
+        raise ValueError('Unsupported correlation method: {0}'.format(method))
+
+    dfTerms = pd.DataFrame({'n': 1.0, 'sx': xValues, 'sy': yValues, 'sxx': xValues * xValues,
+                            'syy': yValues * yValues, 'sxy': xValues * yValues})
+    return dfTerms.groupby([dfPairs[column].to_numpy() for column in by], sort=True).sum().rename_axis(by)
+
+
+def correlationFromMoments(dfMoments: pd.DataFrame):
+    """Correlation coefficient of each group from its moments
+
+    Parameters:
+    dfMoments: pd.DataFrame - output of correlationMoments, possibly summed over chunks
+
+    Returns:
+    corrCoeff: pd.Series - NaN for groups with fewer than 2 pairs or a constant variable
+    """
+    n = dfMoments['n']
+    covariance = n * dfMoments['sxy'] - dfMoments['sx'] * dfMoments['sy']
+    xVariance = n * dfMoments['sxx'] - dfMoments['sx'] ** 2
+    yVariance = n * dfMoments['syy'] - dfMoments['sy'] ** 2
+    denominator = np.sqrt(xVariance.clip(lower=0) * yVariance.clip(lower=0))
+    corrCoeff = (covariance / denominator.where(denominator > 0)).clip(-1, 1)
+    corrCoeff[n < 2] = np.nan
+    return corrCoeff.rename('corrCoeff')
+
+
+def yearlySummary(dfAnnualMeans: pd.DataFrame, years=None, columns: list = ['pdsiAvg', 'precipAvg'],
+                  quantiles: list = [0.25, 0.75]):
+    """Count, sum, mean, median and quantiles of the county annual means for each year
+    Built from a single groupby so callers do not re-filter the frame year by year
+
+    Parameters:
+    dfAnnualMeans: pd.DataFrame - annual means by county and year
+    years?: int[] - years to report, in order; years without data get count and sum 0
+    columns?: list - columns summarized
+    quantiles?: list - extra quantiles, named like pdsiAvgQ25
+
+    Returns:
+    dfSummary: pd.DataFrame - indexed by year, columns <column>Count, <column>Sum,
+        <column>Mean, <column>Median and <column>Q<percent>
+    """
+    grouped = dfAnnualMeans.groupby('year', sort=True, observed=True)[columns]
+    stats = {'Count': grouped.count(), 'Sum': grouped.sum(), 'Mean': grouped.mean(),
+             'Median': grouped.median()}
+    for q in quantiles:
+        stats['Q{0:g}'.format(q * 100)] = grouped.quantile(q)
+
+    dfSummary = pd.concat({name: frame.astype('float64') for name, frame in stats.items()}, axis=1)
+    dfSummary.columns = ['{0}{1}'.format(column, name) for name, column in dfSummary.columns]
+    dfSummary = dfSummary[['{0}{1}'.format(column, name)
+                           for column in columns for name in stats]]
+
+    if (years is not None):
+        dfSummary = dfSummary.reindex(pd.Index(years).astype(dfSummary.index.dtype))
+        for column in columns:
+            dfSummary[[column + 'Count', column + 'Sum']] = dfSummary[[
+                column + 'Count', column + 'Sum']].fillna(0)
+    dfSummary.index.name = 'year'
+    return dfSummary
+
+
+def corrByYearFromMoments(dfMoments: pd.DataFrame, years=None):
+    """year/corrCoeff frame from correlation moments grouped by year
+
+    Parameters:
+    dfMoments: pd.DataFrame - correlationMoments by 'year', possibly summed over chunks
+    years?: int[] - years to report, in order, default every year in dfMoments
+
+    Returns:
+    dfCorrCoeff: pd.DataFrame - year, corrCoeff (years without data are NaN, zero is dropped)
+    """
+    corrCoeff = correlationFromMoments(dfMoments)
+    if (years is None):
+        years = corrCoeff.index.to_numpy()
+    dfCorrCoeff = pd.DataFrame(data={'year': years, 'corrCoeff': corrCoeff.reindex(
+        pd.Index(years).astype(corrCoeff.index.dtype)).to_numpy()})
+    return dfCorrCoeff.loc[dfCorrCoeff['corrCoeff'] != 0].reset_index(drop=True)
+
+
+def quantileGroupKeys(df: pd.DataFrame, period: str = 'year'):
+    """Group key of every row for per period quantiles
+
+    Parameters:
+    df: pd.DataFrame - annual means with 'year' and 'stateFips'
+    period?: str - 'all' (one group), 'year', 'decade' or 'state'
+
+    Returns:
+    keys: pd.Series - group key of each row, named after the period
+    """
+    if (period == 'all'):
+        return pd.Series(0, index=df.index, name='all')
+    if (period == 'year'):
+        return df['year'].rename('year')
+    if (period == 'decade'):
+        return (df['year'] // 10 * 10).rename('decade')
+    if (period == 'state'):
+        return df['stateFips'].rename('stateFips')
+    raise ValueError('Unsupported quantile period: {0}'.format(period))
+
+
+def sortedGroupQuantiles(values: np.ndarray, codes: np.ndarray, groups: int, quantiles: list):
+    """Quantiles of every group from the values sorted by group and value
+    Linear interpolation between the closest ranks, the same as Series.quantile
+
+    Parameters:
+    values: np.ndarray - float values, NaN are skipped, interpolated in float64
+    codes: np.ndarray - group number 0..groups-1 of each value, -1 is skipped
+    groups: int - number of groups
+    quantiles: list - quantiles in [0, 1]
+
+    Returns:
+    np.ndarray - (groups, quantiles), NaN for groups without values
+    """
+    keep = (codes >= 0) & ~np.isnan(values)
+    values = values[keep]
+    codes = codes[keep]
+    # sort the values once, then order their ranks by group with one integer sort
+    order = np.argsort(values)
+    ranks = np.empty(len(values), dtype='int64')
+    ranks[order] = np.arange(len(values))
+    groupRanks = np.sort(codes.astype('int64') * len(values) + ranks)
+    sortedValues = values[order][groupRanks % max(len(values), 1)].astype('float64')
+    counts = np.bincount(codes, minlength=groups)
+    starts = np.cumsum(counts) - counts
+    hasValues = counts > 0
+
+    result = np.full((groups, len(quantiles)), np.nan)
+    for i, q in enumerate(quantiles):
+        position = q * (counts[hasValues] - 1)
+        lower = np.floor(position).astype('int64')
+        upper = np.minimum(lower + 1, counts[hasValues] - 1)
+        fraction = position - lower
+        low = sortedValues[starts[hasValues] + lower]
+        high = sortedValues[starts[hasValues] + upper]
+        # numpy's lerp, interpolating from the closer end keeps the results bit identical
+        result[hasValues, i] = np.where(fraction >= 0.5, high - (high - low) * (1 - fraction),
+                                        low + (high - low) * fraction)
+    return result
+
+
+def quantileColumn(column: str, q: float):
+    """Name of the threshold column of a quantile, e.g. pdsiAvg, 0.25 -> pdsiAvgQ25"""
+    return '{0}Q{1:g}'.format(column, q * 100)
+
+
+def groupedQuantiles(df: pd.DataFrame, period: str = 'year', columns: list = None,
+                     quantiles: list = None):
+    """Quantile thresholds of every period for several columns
+
+    Every column is sorted once by group and value, no per group filtering or groupby
+    quantile calls. annualCube.periodThresholds lines the thresholds up with the cube axes
+
+    Parameters:
+    df: pd.DataFrame - annual means by county and year
+    period?: str - 'all', 'year', 'decade' or 'state', see quantileGroupKeys
+    columns?: list - columns to threshold, default ['pdsiAvg', 'precipAvg']
+    quantiles?: list - quantiles, named like pdsiAvgQ25 (see quantileColumn), default [0.25, 0.75]
+
+    Returns:
+    result: dict - 'thresholds': pd.DataFrame indexed by the period with <column>Q<percent>
+        columns, 'quantiles': the quantiles
+    """
+    columns = columns or ['pdsiAvg', 'precipAvg']
+    quantiles = quantiles or [0.25, 0.75]
+    keys = quantileGroupKeys(df, period)
+    codes, groupKeys = pd.factorize(keys, sort=True)
+
+    thresholds = {}
+    for column in columns:
+        # sorting float32 columns in their own dtype is faster and gives the same order
+        values = df[column].to_numpy()
+        columnThresholds = sortedGroupQuantiles(values, codes, len(groupKeys), quantiles)
+        for i, q in enumerate(quantiles):
+            thresholds[quantileColumn(column, q)] = columnThresholds[:, i]
+
+    dfThresholds = pd.DataFrame(thresholds, index=pd.Index(groupKeys, name=keys.name))
+    return {'thresholds': dfThresholds, 'quantiles': list(quantiles)}
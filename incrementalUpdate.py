@@ -0,0 +1,276 @@
+# Incremental update of the database tables from a new NOAA release
+import json
+import os
+
+import pandas as pd
+
+from databaseConnection import pooledConnection
+from dataCache import pyarrowAvailable, writeCachedFrame, readCachedFrame
+from dataClean import copyIntoTable, readTable
+from dataTypes import monthColumns, compactDtypes
+from machineLearning import concatData
+
+
+def diffByKeys(dfNew: pd.DataFrame, dfStored: pd.DataFrame, keys: list, valueColumns: list):
+    """Get the rows of dfNew that are not stored yet or whose values changed
+
+    Values are compared rounded to 2 decimals, the precision of the NOAA data
+
+    Parameters:
+    dfNew: pd.DataFrame - new release data
+    dfStored: pd.DataFrame - data read from the database
+    keys: list - columns identifying a row, named the same in both frames
+    valueColumns: list - columns compared between the frames
+
+    Returns:
+    dfChanged: pd.DataFrame - new and changed rows of dfNew
+    """
+    dfStored = dfStored[keys + valueColumns].drop_duplicates(subset=keys)
+    merged = dfNew.merge(dfStored, on=keys, how='left',
+                         suffixes=('', '_stored'), indicator=True)
+
+    changed = (merged['_merge'] == 'left_only').values
+    for column in valueColumns:
+        newValues = merged[column].astype(float).round(2)
+        storedValues = merged[column + '_stored'].astype(float).round(2)
+        same = (newValues == storedValues) | (
+            newValues.isna() & storedValues.isna())
+        changed = changed | ~same.values
+
+    return dfNew.loc[changed]
+
+
+def removedByKeys(dfNew: pd.DataFrame, dfStored: pd.DataFrame, keys: list):
+    """Get the keys of the stored rows that are no longer in dfNew
+
+    Parameters:
+    dfNew: pd.DataFrame - new release data
+    dfStored: pd.DataFrame - data read from the database
+    keys: list - columns identifying a row, named the same in both frames
+
+    Returns:
+    dfRemoved: pd.DataFrame - key columns of the rows dropped from the release
+    """
+    merged = dfStored[keys].drop_duplicates().merge(
+        dfNew[keys].drop_duplicates(), on=keys, how='left', indicator=True)
+    return merged.loc[merged['_merge'] == 'left_only', keys].reset_index(drop=True)
+
+
+def upsertRows(dataFrame: pd.DataFrame, tableName: str, columns: list, keys: list,
+               deletedKeys: pd.DataFrame = None):
+    """Replace the rows matching the keys of dataFrame and insert the rest in one transaction
+
+    Rows are copied into a temporary staging table, matching rows are deleted from
+    the table, then the staged rows are inserted.
+
+    Parameters:
+    dataFrame: pd.DataFrame - rows to upsert, columns in the same order as columns
+    tableName: str - destination table
+    columns: list - destination column names
+    keys: list - destination columns identifying a row
+    deletedKeys?: pd.DataFrame - rows to delete in the same transaction, its columns are
+        destination columns matched like keys, e.g. the rows dropped from a release
+
+    Returns:
+    bool - rows were upserted and commited to db successfully
+    """
+    deletedCount = 0 if deletedKeys is None else len(deletedKeys.index)
+    if (len(dataFrame.index) == 0 and deletedCount == 0):
+        print('No new, changed, or removed {0} rows'.format(tableName))
+        return True
+
+    with pooledConnection() as conn:
+        if (conn == None):
+            return False
+        cur = conn.cursor()
+        stageTable = 'stage_{0}'.format(tableName)
+        keyMatch = ' AND '.join(
+            ['t.{0} = s.{0}'.format(key) for key in keys])
+        columnList = ', '.join(columns)
+        try:
+            removedRows = 0
+            if (deletedCount > 0):
+                deleteTable = 'stage_{0}_deleted'.format(tableName)
+                deleteColumns = list(deletedKeys.columns)
+                cur.execute("CREATE TEMP TABLE {0} ON COMMIT DROP AS SELECT {1} FROM {2} WITH NO DATA;".format(
+                    deleteTable, ', '.join(deleteColumns), tableName))
+                copyIntoTable(cur, deletedKeys, deleteTable, deleteColumns)
+                cur.execute("DELETE FROM {0} t USING {1} d WHERE {2};".format(
+                    tableName, deleteTable, ' AND '.join(['t.{0} = d.{0}'.format(column) for column in deleteColumns])))
+                removedRows = cur.rowcount
+            cur.execute("CREATE TEMP TABLE {0} (LIKE {1} INCLUDING DEFAULTS) ON COMMIT DROP;".format(
+                stageTable, tableName))
+            copyIntoTable(cur, dataFrame, stageTable, columns)
+            cur.execute("DELETE FROM {0} t USING {1} s WHERE {2};".format(
+                tableName, stageTable, keyMatch))
+            replacedRows = cur.rowcount
+            cur.execute("INSERT INTO {0} ({1}) SELECT {1} FROM {2};".format(
+                tableName, columnList, stageTable))
+            conn.commit()
+        except Exception as err:
+            print('--- Failed to upsert {0} rows ---'.format(tableName))
+            print(err)
+            conn.rollback()
+            return False
+        else:
+            print('Upserted {0} rows into {1} ({2} replaced, {3} new, {4} removed)'.format(
+                len(dataFrame.index), tableName, replacedRows, len(dataFrame.index) - replacedRows,
+                removedRows))
+            return True
+        finally:
+            cur.close()
+
+
+def pdsiPrecipFingerprint():
+    """Row count and exact sums of the pdsi_precip table, the stored annual means are only
+    reused while the table they were computed from is unchanged
+
+    The measurements are summed as integer hundredths so the sums don't depend on the scan order
+
+    Returns:
+    fingerprint: str - None when the database is unreachable
+    """
+    dfSums = readTable("SELECT count(*) AS rows, sum(year * 12 + month) AS months, "
+                       "sum(hashtext(county_fips::text)::bigint) AS counties, "
+                       "sum(round(pdsi * 100)::bigint) FILTER (WHERE pdsi <> 'NaN') AS pdsi, "
+                       "sum(round(precip * 100)::bigint) FILTER (WHERE precip <> 'NaN') AS precip, "
+                       "count(*) FILTER (WHERE pdsi = 'NaN' OR precip = 'NaN') AS nan "
+                       "FROM pdsi_precip")
+    if (dfSums is None):
+        return None
+    return ','.join(str(value) for value in dfSums.iloc[0].tolist())
+
+
+def incrementalUpdate(dfDrought: pd.DataFrame, dfRain: pd.DataFrame, dfStates: pd.DataFrame):
+    """Upsert only the new or changed rows of a release into rain, drought, and pdsi_precip
+
+    Rows dropped from the release are deleted, the pdsi_precip rows of every affected county
+    year are replaced so a county year without any rows left is removed too
+
+    Parameters:
+    dfDrought: pd.DataFrame - cleaned drought data
+    dfRain: pd.DataFrame - cleaned rain data from the new climdiv release
+    dfStates: pd.DataFrame - state data
+
+    Returns:
+    result: dict - 'combined': combined rows of the affected (county, year) pairs,
+        'affected': county_fips, year pairs, 'storedFingerprint' and 'fingerprint':
+        pdsiPrecipFingerprint before and after the update; None when the update failed
+    """
+    print('Starting Incremental Update ========================')
+    storedFingerprint = pdsiPrecipFingerprint()
+    rainKeys = ['state_id', 'county_id', 'year']
+    storedRain = readTable('SELECT {0} FROM rain'.format(', '.join(rainKeys + monthColumns)),
+                           {'state_id': str, 'county_id': str})
+    storedDrought = readTable('SELECT year, month, state_fips, county_fips, pdsi FROM drought',
+                              {'state_fips': str, 'county_fips': str})
+    if (storedRain is None or storedDrought is None):
+        return None
+
+    dfRainKeyed = dfRain.astype({'year': int})
+    changedRain = diffByKeys(dfRainKeyed, storedRain, rainKeys, monthColumns)
+
+    dfDroughtKeyed = dfDrought.astype({'year': int, 'month': int}).rename(
+        columns={'statefips': 'state_fips', 'countyfips': 'county_fips'})
+    changedDrought = diffByKeys(dfDroughtKeyed, storedDrought, [
+                                'state_fips', 'county_fips', 'year', 'month'], ['pdsi'])
+    removedRain = removedByKeys(dfRainKeyed, storedRain, rainKeys)
+    removedDrought = removedByKeys(dfDroughtKeyed, storedDrought, ['county_fips', 'year', 'month'])
+
+    if (not upsertRows(changedRain[rainKeys + monthColumns], 'rain',
+                       rainKeys + monthColumns, rainKeys, removedRain)):
+        return None
+    if (not upsertRows(changedDrought[['year', 'month', 'state_fips', 'county_fips', 'pdsi']], 'drought',
+                       ['year', 'month', 'state_fips', 'county_fips', 'pdsi'],
+                       ['county_fips', 'year', 'month'], removedDrought)):
+        return None
+
+    # (county, year) pairs touched by either source, including the removed rows
+    noaaToFips = dict(zip(dfStates['noaa_state_fips'], dfStates['state_fips']))
+    rainTouched = pd.concat([changedRain[rainKeys], removedRain])
+    rainAffected = pd.DataFrame({
+        'county_fips': rainTouched['state_id'].map(noaaToFips) + rainTouched['county_id'],
+        'year': rainTouched['year']})
+    affected = pd.concat([rainAffected, changedDrought[['county_fips', 'year']],
+                          removedDrought[['county_fips', 'year']]])
+    affected = affected.dropna().drop_duplicates().reset_index(drop=True)
+    print('{0} county years affected by the release'.format(len(affected.index)))
+
+    affectedIndex = pd.MultiIndex.from_frame(affected)
+    droughtIndex = pd.MultiIndex.from_arrays(
+        [dfDrought['countyfips'], dfDrought['year'].astype(int)])
+    dfDroughtAffected = dfDrought.loc[droughtIndex.isin(affectedIndex)].copy()
+    dfRainAffected = dfRain.loc[dfRain['year'].astype(int).isin(affected['year'].unique())]
+    dfCombined = concatData(dfDroughtAffected, dfRainAffected, dfStates)
+
+    # every affected county year is deleted and refilled, county years left without rows stay deleted
+    if (not upsertRows(dfCombined[['year', 'month', 'county_fips', 'pdsi', 'rainfall', 'state_fips']],
+                       'pdsi_precip', ['year', 'month', 'county_fips', 'pdsi', 'precip', 'state_fips'],
+                       ['county_fips', 'year', 'month'], affected[['county_fips', 'year']])):
+        return None
+
+    print('Finished Incremental Update ========================')
+    return {'combined': dfCombined, 'affected': affected,
+            'storedFingerprint': storedFingerprint, 'fingerprint': pdsiPrecipFingerprint()}
+
+
+def loadAnnualMeans(dbFingerprint: str, path: str = 'sourceData/cache/annualMeans.parquet'):
+    """Load the annual means saved by the previous run, None if there are none or they were
+    not computed from the current pdsi_precip table
+
+    Parameters:
+    dbFingerprint: str - pdsiPrecipFingerprint of the table before this run changed it
+    path?: str - parquet file, its fingerprint is stored next to it in a .json file
+    """
+    fingerprintPath = os.path.splitext(path)[0] + '.json'
+    if (not pyarrowAvailable or dbFingerprint == None or not os.path.exists(path)
+            or not os.path.exists(fingerprintPath)):
+        return None
+    with open(fingerprintPath) as f:
+        if (json.load(f).get('dbFingerprint') != dbFingerprint):
+            print('Stored annual means are out of date with pdsi_precip, recomputing them')
+            return None
+    return compactDtypes(readCachedFrame(path))
+
+
+def saveAnnualMeans(dfAnnualMeans: pd.DataFrame, path: str = 'sourceData/cache/annualMeans.parquet',
+                    dbFingerprint: str = None):
+    """Save the annual means so the next incremental run only recomputes affected years
+
+    Parameters:
+    dfAnnualMeans: pd.DataFrame - annual means of this run
+    path?: str - parquet file
+    dbFingerprint?: str - pdsiPrecipFingerprint of the table the means match, None when they
+        were computed from the csvs alone and loadAnnualMeans should not reuse them
+    """
+    if (not pyarrowAvailable):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    writeCachedFrame(dfAnnualMeans, path)
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+        json.dump({'dbFingerprint': dbFingerprint}, f)
+
+
+def updateAnnualMeans(dfAnnualMeans: pd.DataFrame, dfAffectedMeans: pd.DataFrame, affected: pd.DataFrame):
+    """Replace the (countyFips, year) rows of the stored annual means with recomputed ones
+
+    Parameters:
+    dfAnnualMeans: pd.DataFrame - annual means of the previous run
+    dfAffectedMeans: pd.DataFrame - annual means recomputed for the affected county years
+    affected: pd.DataFrame - county_fips, year pairs of the release, see incrementalUpdate;
+        stored county years without recomputed means were removed and are dropped
+
+    Returns:
+    dfAnnualMeans: pd.DataFrame - merged annual means sorted by countyFips and year
+    """
+    storedIndex = pd.MultiIndex.from_arrays(
+        [dfAnnualMeans['countyFips'].astype(str), dfAnnualMeans['year'].astype(int)])
+    affectedIndex = pd.MultiIndex.from_arrays(
+        [affected['county_fips'].astype(str), affected['year'].astype(int)])
+    dfKept = dfAnnualMeans.loc[~storedIndex.isin(affectedIndex)]
+
+    dfMerged = pd.concat([dfKept.astype({'countyFips': str, 'stateFips': str}),
+                          dfAffectedMeans.astype({'countyFips': str, 'stateFips': str})])
+    dfMerged = compactDtypes(dfMerged)
+    dfMerged = dfMerged.sort_values(['countyFips', 'year']).reset_index(drop=True)
+    return dfMerged
@@ -0,0 +1,194 @@
+# Per stage wall time, cpu time, peak memory, and row count records with json or chrome trace reports
+from contextlib import contextmanager
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak rss is reported as None there
+    resource = None
+
+
+# every finished stage of this process, in the order they finished
+records = []
+# wall clock origin of the trace timestamps
+traceStart = time.perf_counter()
+stageDepth = threading.local()
+
+
+def getPeakRssMB():
+    """Peak resident memory of the process so far, None when it can not be read"""
+    if (resource == None):
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def countRows(value):
+    """Rows of a DataFrame or Series, None for anything else"""
+    if (isinstance(value, (pd.DataFrame, pd.Series))):
+        return len(value.index)
+    return None
+
+
+@contextmanager
+def stage(name: str, category: str = 'stage', rows: int = None):
+    """Record the wall time, cpu time, and peak rss of the wrapped block
+
+    Usage:
+    with stage('concatData') as record:
+        ...
+        record['rows'] = len(df.index)
+
+    Parameters:
+    name: str - stage name in the report
+    category?: str - group of the stage, e.g. 'ingest', 'insert', 'export'
+    rows?: int - rows processed, can also be set on the yielded record
+
+    Yields: record dict, added to records when the block exits
+    """
+    depth = getattr(stageDepth, 'value', 0)
+    stageDepth.value = depth + 1
+    record = {'name': name, 'category': category, 'rows': rows, 'depth': depth,
+              'pid': os.getpid(), 'tid': threading.get_ident()}
+    rssBefore = getPeakRssMB()
+    cpuStart = time.process_time()
+    wallStart = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['wallSeconds'] = time.perf_counter() - wallStart
+        record['cpuSeconds'] = time.process_time() - cpuStart
+        record['start'] = wallStart - traceStart
+        record['peakRssMB'] = getPeakRssMB()
+        record['peakRssGrowthMB'] = (None if rssBefore == None
+                                     else record['peakRssMB'] - rssBefore)
+        stageDepth.value = depth
+        records.append(record)
+
+
+def instrumented(name: str = None, category: str = 'stage'):
+    """Decorator recording every call of a function as a stage
+
+    rows are taken from the returned DataFrame, or from the first DataFrame argument
+    when the function returns something else (inserts, exports)
+
+    Parameters:
+    name?: str - stage name, default the function name
+    category?: str - group of the stage
+
+    Returns: decorator
+    """
+    def decorator(func):
+        stageName = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stageName, category) as record:
+                result = func(*args, **kwargs)
+                record['rows'] = countRows(result)
+                if (record['rows'] == None):
+                    record['rows'] = next((countRows(arg) for arg in args
+                                           if countRows(arg) != None), None)
+            return result
+        return wrapper
+    return decorator
+
+
+def recordsSince(mark: int):
+    """Stages recorded after records held mark entries, a worker task returns them with its
+    result since the records of a worker process are not seen by the parent
+
+    Usage:
+    mark = len(records)
+    ...
+    return result, recordsSince(mark)
+    """
+    return records[mark:]
+
+
+def mergeRecords(workerRecords: list):
+    """Add the stages a worker process recorded, they keep the pid of the worker
+
+    Forked workers share the trace clock of the parent, their starts line up with its stages
+    """
+    records.extend(workerRecords)
+
+
+def resetRecords():
+    """Drop the recorded stages, e.g. between benchmark runs"""
+    records.clear()
+
+
+def summarizeRecords():
+    """Totals of the recorded stages grouped by name
+
+    Returns:
+    dfSummary: pd.DataFrame - name, category, calls, wallSeconds, cpuSeconds, rows,
+        peakRssMB sorted by wall time
+    """
+    if (not records):
+        return pd.DataFrame(columns=['name', 'category', 'calls', 'wallSeconds',
+                                     'cpuSeconds', 'rows', 'peakRssMB'])
+    dfRecords = pd.DataFrame(records)
+    dfRecords['rows'] = pd.to_numeric(dfRecords['rows']).fillna(0)
+    dfSummary = dfRecords.groupby(['name', 'category'], sort=False).agg(
+        calls=('wallSeconds', 'size'), wallSeconds=('wallSeconds', 'sum'),
+        cpuSeconds=('cpuSeconds', 'sum'), rows=('rows', 'sum'), peakRssMB=('peakRssMB', 'max'))
+    return dfSummary.reset_index().sort_values('wallSeconds', ascending=False).reset_index(drop=True)
+
+
+def printSummary():
+    """Print the stage totals, slowest first"""
+    dfSummary = summarizeRecords()
+    print('Stage Timings ========================')
+    for row in dfSummary.itertuples(index=False):
+        print('{0:<32} {1:>4} calls {2:>9.3f}s wall {3:>9.3f}s cpu {4:>12} rows {5}'.format(
+            row.name, row.calls, row.wallSeconds, row.cpuSeconds, int(row.rows),
+            '' if pd.isna(row.peakRssMB) else 'peak rss {0:.0f} MB'.format(row.peakRssMB)))
+
+
+def writeReport(path: str, traceFormat: str = 'chrome'):
+    """Write the recorded stages to a file
+
+    Parameters:
+    path: str - report location
+    traceFormat?: str - 'chrome' for a trace viewable in chrome://tracing or Perfetto,
+        'json' for the raw records and the per stage summary
+
+    Returns:
+    bool - report was written
+    """
+    if (traceFormat == 'chrome'):
+        report = {'traceEvents': [{
+            'name': record['name'], 'cat': record['category'], 'ph': 'X',
+            'ts': record['start'] * 1e6, 'dur': record['wallSeconds'] * 1e6,
+            'pid': record['pid'], 'tid': record['tid'],
+            'args': {'cpuSeconds': record['cpuSeconds'], 'rows': record['rows'],
+                     'peakRssMB': record['peakRssMB']}} for record in records],
+            'displayTimeUnit': 'ms'}
+    elif (traceFormat == 'json'):
+        report = {'records': records,
+                  'summary': summarizeRecords().to_dict('records')}
+    else:
+        raise ValueError('Unsupported trace format: {0}'.format(traceFormat))
+
+    try:
+        if (os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
+    except Exception as err:
+        print('Could not write instrumentation report: {0}'.format(err))
+        return False
+    else:
+        print('Wrote {0} stage records to {1}'.format(len(records), path))
+        return True
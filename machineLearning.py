@@ -1,13 +1,12 @@
-import time
-import warnings
-
 import numpy as np
-import matplotlib.pyplot as plt
 
 import pandas as pd
-from sklearn.neighbors import KNeighborsRegressor
+
+from dataTypes import monthColumns, compactDtypes
+from instrumentation import instrumented
 
 
+@instrumented(category='merge')
 def concatData(dfDrought: pd.DataFrame, dfRain: pd.DataFrame, dfStates: pd.DataFrame):
     """Concat Data method concats rainfall data to each entry to pdsi dataframe
     convert the dataframe to a numpy array for sklearn
@@ -28,25 +27,25 @@ def concatData(dfDrought: pd.DataFrame, dfRain: pd.DataFrame, dfStates: pd.DataF
     dfMergeRain['countyfips'] = dfMergeRain['state_fips'] + \
         dfMergeRain['county_id']
 
-    dfMergeRain['year'] = dfMergeRain['year'].astype(int)
-    dfDrought['year'] = dfDrought['year'].astype(int)
-
-    dfMergeRainDrought = pd.merge(dfDrought, dfMergeRain, on=[
-                                  'year', 'countyfips'], how='left')
-
-    # month translation dict for tuple index
-    months = {1: 6, 2: 7, 3: 8, 4: 9, 5: 10, 6: 11,
-              7: 12, 8: 13, 9: 14, 10: 15, 11: 16, 12: 17}
-    dataForDF = {'year': [], 'month': [], 'county_fips': [],
-                 'pdsi': [], 'rainfall': [], 'state_fips': []}
-    for row in dfMergeRainDrought.itertuples(index=False):
-        dataForDF['year'].append(row[0])
-        dataForDF['month'].append(row[1])
-        dataForDF['county_fips'].append(row[3])
-        dataForDF['pdsi'].append(row[4])
-        dataForDF['rainfall'].append(row[months[row[1]]])
-        dataForDF['state_fips'].append(row[2])
-    dfNewDroughtRain = pd.DataFrame(data=dataForDF)
+    dfMergeRain['year'] = dfMergeRain['year'].astype('int16')
+    dfDrought['year'] = dfDrought['year'].astype('int16')
+
+    # melt the wide jan..dec rain columns into one (year, month, countyfips) row per month
+    dfRainLong = dfMergeRain.melt(id_vars=['year', 'countyfips'], value_vars=monthColumns,
+                                  var_name='month', value_name='rainfall')
+    dfRainLong['month'] = dfRainLong['month'].map(
+        {name: number for number, name in enumerate(monthColumns, start=1)}).astype('int8')
+
+    dfMergeRainDrought = pd.merge(dfDrought, dfRainLong, on=[
+                                  'year', 'month', 'countyfips'], how='left')
+
+    dfNewDroughtRain = dfMergeRainDrought[[
+        'year', 'month', 'countyfips', 'pdsi', 'rainfall', 'statefips']]
+    dfNewDroughtRain = dfNewDroughtRain.rename(
+        columns={'countyfips': 'county_fips', 'statefips': 'state_fips'})
+    dfNewDroughtRain = dfNewDroughtRain.reset_index(drop=True)
+    dfNewDroughtRain = compactDtypes(
+        dfNewDroughtRain, 'Combined PDSI and Precip')
 
     return dfNewDroughtRain
 
@@ -84,9 +83,9 @@ def getAnnualQuantileCountyDatasetPrecip(dfAnnualMeans: pd.DataFrame, annualPdsi
     Returns:
     annualQuartiles: {'q1', 'q3'}
     """
-    dfLowerQuart = dfAnnualMeans[dfAnnualMeans['pdsiAvg']
+    dfLowerQuart = dfAnnualMeans[dfAnnualMeans['precipAvg']
                                  <= annualPrecipQuantile[0.25]]
-    dfUpperQuart = dfAnnualMeans[dfAnnualMeans['pdsiAvg']
+    dfUpperQuart = dfAnnualMeans[dfAnnualMeans['precipAvg']
                                  >= annualPrecipQuantile[0.75]]
     dfIqr = annualPrecipQuantile[0.75] - annualPrecipQuantile[0.25]
 
@@ -95,22 +94,48 @@ def getAnnualQuantileCountyDatasetPrecip(dfAnnualMeans: pd.DataFrame, annualPdsi
     return annualQuartiles
 
 
-def kNearestNeighborModels(df: pd.DataFrame):
-    """K nearest neighbor regression lines
+def kNearestNeighborSmooth(x: np.ndarray, Y: np.ndarray, k: int = 10, gridSize: int = 100):
+    """Uniform and distance weighted k nearest neighbor regression of several series sharing x
+    The neighbor index is built once and queried once, both weightings come from the same
+    neighbors, matching KNeighborsRegressor (a grid point on top of samples only averages them)
 
-    Get the weighted and unweighted average of nearest plots to get the regression lines
+    Parameters:
+    x: np.ndarray - sample positions, shape (n,)
+    Y: np.ndarray - sample values, shape (n,) or (n, series)
+    k?: int - neighbors per grid point
+    gridSize?: int - evenly spaced grid points between x.min() and x.max()
+
+    Returns:
+    d: dict - 'xRange': grid (gridSize,), 'yUni' and 'yDist': predictions shaped like
+        Y with gridSize rows
     """
-    X = df.year.values.reshape(-1, 1)
+    # sklearn is only needed for the charts, import it on first use
+    from sklearn.neighbors import NearestNeighbors
+
+    X = np.asarray(x, dtype=float).reshape(-1, 1)
+    Y = np.asarray(Y, dtype=float)
+    xRange = np.linspace(X.min(), X.max(), gridSize)
+    distances, indices = NearestNeighbors(n_neighbors=k).fit(
+        X).kneighbors(xRange.reshape(-1, 1))
+
+    neighbors = Y[indices]
+    yUni = neighbors.mean(axis=1)
 
-    xRange = np.linspace(X.min(), X.max(), 100)
+    with np.errstate(divide='ignore'):
+        weights = 1.0 / distances
+    exact = np.isinf(weights)
+    exactRows = exact.any(axis=1)
+    weights[exactRows] = exact[exactRows]
+    if (Y.ndim > 1):
+        weights = weights[:, :, np.newaxis]
+    yDist = (neighbors * weights).sum(axis=1) / weights.sum(axis=1)
 
-    knnUniform = KNeighborsRegressor(10, weights='uniform')
-    knnUniform.fit(X, df.countyAmt)
-    y_uni = knnUniform.predict(xRange.reshape(-1, 1))
+    return {'xRange': xRange, 'yDist': yDist, 'yUni': yUni}
 
-    knnDist = KNeighborsRegressor(10, weights='distance')
-    knnDist.fit(X, df.countyAmt)
-    yDist = knnDist.predict(xRange.reshape(-1, 1))
 
-    d = {'xRange': xRange, 'yDist': yDist, 'yUni': y_uni}
-    return d
+def kNearestNeighborModels(df: pd.DataFrame, k: int = 10, gridSize: int = 100):
+    """K nearest neighbor regression lines
+
+    Get the weighted and unweighted average of nearest plots to get the regression lines
+    """
+    return kNearestNeighborSmooth(df.year.values, df.countyAmt.values, k, gridSize)
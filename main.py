@@ -1,23 +1,28 @@
-from distutils.log import debug
-from os import stat
-import sys
-from typing import Dict
-import numpy as np
-from numpy.lib.function_base import median
+import time
+startTime = time.perf_counter()
 
-from pandas.core.frame import DataFrame
-import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
-from databaseConnection import databaseConnected
+from databaseConnection import databaseConnected, configureConnectionPool, closeConnectionPool
 from createTables import createDroughtTable, createCountiesTable, createStatesTable, createRainTable, createPdsiPrecipTable
-from dataClean import ingestCSV, cleanFips, insertIntoDrought, insertIntoStates, insertIntoCounties, insertMissingCounties, insertIntoPdsiPrecip, cleanFipsCols, getGeoData, cleanRainfallData, insertIntoRain, addThreeDigitFipsToCounties
-from visualization import generateScatterPlot, genScatterPltNonlin, genCountyChartTimeline, genCountyChart, lineChartPrecip, visualizeCountiesAllYears, stackedHistogram, genCountyPrecipCombined, genCountyPDSICombined, genCountyLowerQuartilePdsi, genCountyLowerQuartilePrecip, genBubbleChart, lineChartCorr
-from machineLearning import getAnnualQuantileCountyDatasetPdsi, getAnnualQuantileCountyDatasetPrecip, concatData
-
-
+from dataClean import cleanFips, insertIntoDrought, insertIntoStates, insertIntoCounties, insertMissingCounties, insertIntoPdsiPrecip, insertIntoRain
+from dataCache import loadCleanedSources
+from dataTypes import setMemoryReports
+from instrumentation import instrumented, printSummary, writeReport
+from renderCache import setRenderCacheEnabled, printCacheStats
+from migrations import migrateSchema
+from incrementalUpdate import incrementalUpdate, loadAnnualMeans, saveAnnualMeans, updateAnnualMeans, pdsiPrecipFingerprint
+from annualCube import buildAnnualCube, saveAnnualCube, loadAnnualCube, annualMeansFingerprint, periodThresholds, quartileMasks, maskedFrame
+from aggregation import getAverageAnnual, annualPrecipCombined, annualPdsiPrecipCorr
+from groupedStats import groupedQuantiles, quantileColumn
+from sqlAggregation import getAverageAnnualSql, annualPrecipCombinedSql, annualPdsiPrecipCorrSql, annualMeansCorrSql
+from machineLearning import concatData
+
+
+@instrumented(category='clean')
 def cleanAndPrep(dfDrought: pd.DataFrame, dfCounties: pd.DataFrame,
                  dfStates: pd.DataFrame, dfRain: pd.DataFrame,
-                 newDB: bool = False):
+                 newDB: bool = False, doesNotInclude: dict = None):
     """Clean, prep, and insert data into database
 
     Parameters:
@@ -26,6 +31,7 @@ def cleanAndPrep(dfDrought: pd.DataFrame, dfCounties: pd.DataFrame,
     dfStates: pd.DataFrame - state data
     dfRain: pd.DataFrame - rain data
     newDB?: bool - optional True = wipe data and insert all, default = False
+    doesNotInclude?: dict - cleanFips result when the fips were already checked
 
     Returns:
     bool - data cleaned and successfully inserted into database
@@ -48,7 +54,8 @@ def cleanAndPrep(dfDrought: pd.DataFrame, dfCounties: pd.DataFrame,
         return False
 
     # main fips cleaning for joining data
-    doesNotInclude = cleanFips(dfDrought, dfCounties, dfStates)
+    if (doesNotInclude == None):
+        doesNotInclude = cleanFips(dfDrought, dfCounties, dfStates)
 
     if (databaseConnected() and droughtTable and countiesTable and statesTable and rainTable):
         if (doesNotInclude['stateErrors'] + doesNotInclude['countyErrors'] == 0):
@@ -67,6 +74,8 @@ def cleanAndPrep(dfDrought: pd.DataFrame, dfCounties: pd.DataFrame,
 
 
 def generateVisualizations(dfDrought):
+    from visualization import stackedHistogram
+
     # generateScatterPlot(dfDrought)
     # genScatterPltNonlin(dfDrought)
     # genCountyChart(dfDrought)
@@ -81,106 +90,51 @@ def generateAllCountyVisualization(dfDrought, yearsNp):
         yearStr = year.astype(str)
 
 
-def getAverageAnnual(dfCombined: pd.DataFrame, counties: np.array, years: np.array):
-    """get the annual PDSI average by county
-
-    Parameters:
-    dfCombined: pd.DataFrame - combined drought and precip data
-    counties: np.array - np array counties
-
-    Returns:
-    dfPDSI: pd.DataFrame - dataframe with annual average PDSI
-    """
-    print('Calculating Averages Consolidated Annually ========================')
-    annualMeanData = {'year': [], 'countyFips': [], 'stateFips': [],
-                      'pdsiAvg': [], 'precipAvg': []}
-
-    for index, g in dfCombined.groupby(['county_fips', 'year']):
-        annualMeanData['year'].append(g['year'].unique()[0])
-        annualMeanData['countyFips'].append(g['county_fips'].unique()[0])
-        annualMeanData['stateFips'].append(g['state_fips'].unique()[0]),
-        annualMeanData['pdsiAvg'].append(round(g['pdsi'].mean(), 2))
-        annualMeanData['precipAvg'].append(round(g['rainfall'].mean(), 2))
-
-    dfAnnualMeans = pd.DataFrame(annualMeanData)
-    dfAnnualMeans = dfAnnualMeans.loc[dfAnnualMeans.index.drop_duplicates()]
-    print('Finished gathering counties')
-
-    return dfAnnualMeans
-
-
-def visualizations(dfDrought: pd.DataFrame, dfCombined: pd.DataFrame, dfAnnualMeans: pd.DataFrame, years: np.ndarray):
+def visualizations(dfDrought: pd.DataFrame, dfCombined: pd.DataFrame, dfAnnualMeans: pd.DataFrame, years: np.ndarray,
+                   workers: int = 4, cube: dict = None):
     """Method to run all visualizations
 
     Parameters:
     dfDrought: pd.DataFrame - drought data
     dfCombined: pd.DataFrame - combined pdsi and precipitation data
     years: 
+    workers?: int - number of processes rendering the county maps
+    cube?: dict - year x county x metric array of dfAnnualMeans, see annualCube
     """
-    print('Starting Visualizations ========================')
-
-    for year in years:
-        # annual precip by year
-        genCountyPrecipCombined(
-            dfAnnualMeans, 'annualAvgPrecip' + str(year), year)
+    # plotly, kaleido, and the geo data are only loaded when drawing
+    from visualization import renderCountyMapsParallel
 
-        # annual pdsi by year
-        genCountyPDSICombined(dfAnnualMeans, 'annualAvgPDSI' + str(year), year)
+    print('Starting Visualizations ========================')
 
-        print(year)
+    # annual precip and pdsi maps by year
+    renderCountyMapsParallel(dfAnnualMeans, years, workers, cube)
 
     print('Finished Visualizations ========================')
 
 
-def quartileVisualizations(quartilePdsi, quartilePrecip, years):
+def quartileVisualizations(cube, quartilePdsi, quartilePrecip, years):
     """Generate visualizations that depend on initial binning on quartile
 
     Parameters:
-    quartilePdsi
-    quartilePrecip
+    cube: dict - year x county x metric array of the annual means, see annualCube
+    quartilePdsi: dict - 'q1', 'q3' pdsi quartile masks of the cube, see annualCube.quartileMasks
+    quartilePrecip: dict - 'q1', 'q3' precip quartile masks of the cube
     years: int[] - array of valid years to calculate off of
 
     Returns: Void
     """
-    genBubbleChart(quartilePdsi.get(
-        'q1'), years, 'Annual Average PDSI Lower Quartile (Dry)', 'Q1', 'LowerQuartileAnnualAvgPdsi', 'k-nearest Neighbor Regression Annual PDSI Lower Quartile')
-
-    genBubbleChart(quartilePdsi.get(
-        'q3'), years, 'Annual Average PDSI Upper Quartile (Wet)', 'Q3', 'UpperQuartileAnnualAvgPdsi', 'k-nearest Neighbor Regression Annual PDSI Upper Quartile')
-
-    genCountyLowerQuartilePdsi(quartilePdsi.get('q1'), 'LowerQuartilePdsi')
-
-    genCountyLowerQuartilePrecip(
-        quartilePrecip.get('q1'), 'LowerQuartilePrecip')
+    from visualization import genBubbleChart, genCountyLowerQuartilePdsi, genCountyLowerQuartilePrecip
 
+    genBubbleChart(None, years, 'Annual Average PDSI Lower Quartile (Dry)', 'Q1', 'LowerQuartileAnnualAvgPdsi',
+                   'k-nearest Neighbor Regression Annual PDSI Lower Quartile', cube=cube, mask=quartilePdsi['q1'])
 
-def annualPdsiPrecipCorr(dfCombinedDroughtRainData: pd.DataFrame, years):
-    forDataFrame = {'year': [], 'corrCoeff': []}
-    for year in years:
-        corrCoeff = dfCombinedDroughtRainData.loc[dfCombinedDroughtRainData['year'] == year].corr(
-            'pearson')['rainfall']['pdsi']
-        if (corrCoeff):
-            forDataFrame['year'].append(year)
-            forDataFrame['corrCoeff'].append(corrCoeff)
-    dfCorrCoeff = pd.DataFrame(data=forDataFrame)
+    genBubbleChart(None, years, 'Annual Average PDSI Upper Quartile (Wet)', 'Q3', 'UpperQuartileAnnualAvgPdsi',
+                   'k-nearest Neighbor Regression Annual PDSI Upper Quartile', cube=cube, mask=quartilePdsi['q3'])
 
-    return dfCorrCoeff
+    genCountyLowerQuartilePdsi(maskedFrame(cube, quartilePdsi['q1']), 'LowerQuartilePdsi')
 
-
-def annualPrecipCombined(dfAnnualMeans: pd.DataFrame, years):
-    forDataFrame = {'year': [], 'precipAvg': [], 'precipMedian': []}
-    for year in years:
-        precipAvg = dfAnnualMeans.loc[dfAnnualMeans['year']
-                                      == year]['precipAvg'].mean()
-        precipMedian = dfAnnualMeans.loc[dfAnnualMeans['year']
-                                         == year]['precipAvg'].median()
-        if (precipAvg and precipMedian):
-            forDataFrame['year'].append(year)
-            forDataFrame['precipAvg'].append(precipAvg)
-            forDataFrame['precipMedian'].append(precipMedian)
-    dfAnnualPrecipCombined = pd.DataFrame(data=forDataFrame)
-
-    return dfAnnualPrecipCombined
+    genCountyLowerQuartilePrecip(
+        maskedFrame(cube, quartilePrecip['q1']), 'LowerQuartilePrecip')
 
 
 def main():
@@ -189,87 +143,241 @@ def main():
     performVisualizations = False
     performQuartileVisualizations = True
     performLineVisualizations = True
+    useSourceCache = True
+    # upsert only new or changed rows of a new NOAA release instead of recreating tables
+    performIncrementalUpdate = False
+    renderWorkers = 4
+    dbPoolSize = 4
+    # compact types, decade partitions, and indexes for the drought, rain, and pdsi_precip tables
+    # rebuilds and swaps the tables, so it only runs when turned on
+    performSchemaMigration = False
+    # 'pandas' computes the aggregations in memory, 'sql' pushes them down to the pdsi_precip table,
+    # 'streaming' aggregates the source csvs one state at a time with bounded memory,
+    # 'parallel' runs the clean, merge, and aggregate stages per state on computeWorkers processes
+    computeEngine = 'pandas'
+    computeWorkers = 4
+    # per stage wall, cpu, peak rss, and rows; 'chrome' traces open in chrome://tracing or Perfetto
+    instrumentationReport = 'sourceData/cache/runTrace.json'
+    instrumentationFormat = 'chrome'
+    # reuse exported charts whose figure data and layout did not change since the last run
+    useRenderCache = True
+    # before and after memory of every frame converted to compact dtypes
+    printMemoryReports = False
+    # quartile thresholds over 'all' annual means, or per 'year', 'decade' or 'state'
+    quantilePeriod = 'all'
+
+    print('Startup time: {0:.2f}s ========================'.format(
+        time.perf_counter() - startTime))
+
+    # one pool of database connections shared by the create, insert, and query stages
+    configureConnectionPool(minConn=1, maxConn=dbPoolSize)
+    setRenderCacheEnabled(useRenderCache)
+    setMemoryReports(printMemoryReports)
+
+    useSqlEngine = computeEngine == 'sql'
+    useStreamingEngine = computeEngine == 'streaming'
+    useParallelEngine = computeEngine == 'parallel'
+    # the streaming engine is the ingest path of the drought and rain csvs, they are read in
+    # chunks into state partitions and never loaded whole, unless the tables are filled from them
+    streamSources = useStreamingEngine and not populateNewDbTables and not performIncrementalUpdate
+    # incremental runs recompute only the county years a release touched, never the whole frame
+    incrementalMode = performIncrementalUpdate and not populateNewDbTables
+
+    # ingest and clean source csv data, warm runs load the cleaned frames from the parquet cache
+    dfDrought, dfCounties, dfStates, dfRain = loadCleanedSources(
+        useSourceCache, skip=['drought', 'rain'] if streamSources else None)
+
+    # the state engines check the fips of every state while they aggregate, their summed
+    # error counts stand in for the whole frame check of cleanAndPrep
+    stateResult = None
+    if (streamSources):
+        from streamingPipeline import streamAnnualMeans
+        stateResult = streamAnnualMeans(dfCounties, dfStates)
+        # the drought frame is never built, its years and counties come from the partitions
+        years = stateResult['years']
+        counties = stateResult['counties']
+    else:
+        years = dfDrought['year'].unique()
+        counties = dfDrought['countyfips'].unique()
 
-    # counties = getGeoData()
-    # ingest source csv data
-    dfDrought = ingestCSV()
-    dfCounties = ingestCSV('sourceData/counties.csv')
-    dfStates = ingestCSV('sourceData/states.csv')
-    dfRain = ingestCSV('sourceData/climdiv-pcpncy-v1.0.0-20220108.csv')
-
-    # clean the fips columns
-    dfDrought = cleanFipsCols(dfDrought, 'countyfips', 5)
-    dfDrought = cleanFipsCols(dfDrought, 'statefips', 2)
-    dfCounties = cleanFipsCols(dfCounties, 'county_fips', 5)
-    dfStates = cleanFipsCols(dfStates, 'noaa_state_fips', 2)
-    dfStates = cleanFipsCols(dfStates, 'state_fips', 2)
-    dfRain = cleanFipsCols(dfRain, 'id_code', 11)
-
-    # add additional data
-    dfRain = cleanRainfallData(dfRain)
-    dfCounties = addThreeDigitFipsToCounties(dfCounties)
+    if (useParallelEngine and not incrementalMode):
+        from parallelPipeline import runStatePartitioned
+        stateResult = runStatePartitioned(
+            dfDrought, dfRain, dfCounties, dfStates, years, computeWorkers)
 
     # last param to True if database tables to be dropped and re-inserted
     # send True as the final input on cleanAndPrep to insert new data to database
     if (performDataClean):
+        doesNotInclude = None
+        if (stateResult != None):
+            doesNotInclude = {'stateErrors': stateResult['stateErrors'],
+                              'countyErrors': stateResult['countyErrors']}
         dataCleaned = cleanAndPrep(
-            dfDrought, dfCounties, dfStates, dfRain, populateNewDbTables)
+            dfDrought, dfCounties, dfStates, dfRain, populateNewDbTables, doesNotInclude)
     else:
         dataCleaned = False
 
-    years = dfDrought['year'].unique()
-    counties = dfDrought['countyfips'].unique()
-
     if (dataCleaned or performDataClean is False):
         cleanStatus = 'completed successfully' if dataCleaned else 'skipped'
         print('Data cleaning {0} ========================'.format(cleanStatus))
 
         # dataframe of concatenated drought, precipitation, and state data
-        dfCombinedDroughtRainData = concatData(dfDrought, dfRain, dfStates)
+        # the sql engine reads pdsi_precip instead, it only needs the frame to fill the table
+        # the streaming and parallel engines merge one state at a time and never build the full frame
+        # incremental runs merge only the affected county years
+        dfCombinedDroughtRainData = None
+        usePandasEngine = not useSqlEngine and not useStreamingEngine and not useParallelEngine
+        if ((usePandasEngine and not incrementalMode) or populateNewDbTables):
+            dfCombinedDroughtRainData = concatData(dfDrought, dfRain, dfStates)
 
         # insert PDSI precip table
+        pdsiPrecipInserted = False
         if (populateNewDbTables):
             if (createPdsiPrecipTable()):
-                insertIntoPdsiPrecip(dfCombinedDroughtRainData)
+                pdsiPrecipInserted = insertIntoPdsiPrecip(dfCombinedDroughtRainData)
 
-        # gets average annual precip and pdsi by each year by each county
-        dfAnnualMeans = getAverageAnnual(
-            dfCombinedDroughtRainData, counties, years)
+        # apply pending schema migrations, a no-op once the tables are up to date
+        if (performSchemaMigration and databaseConnected()):
+            migrateSchema()
 
-        dfAnnualPrecipCombined = annualPrecipCombined(dfAnnualMeans, years)
+        incrementalResult = None
+        if (incrementalMode):
+            incrementalResult = incrementalUpdate(dfDrought, dfRain, dfStates)
+
+        # gets average annual precip and pdsi by each year by each county
+        # incremental runs only recompute the county years touched by the release, the stored
+        # means are reused only if pdsi_precip is what they were computed from before the update
+        dfAnnualMeans = None
+        # pdsiPrecipFingerprint of the table the annual means match, None when they only match the csvs
+        meansDbFingerprint = None
+        if (incrementalResult and useSourceCache):
+            meansDbFingerprint = incrementalResult['fingerprint']
+            dfStoredMeans = loadAnnualMeans(incrementalResult['storedFingerprint'])
+            if (dfStoredMeans is not None):
+                dfAnnualMeans = updateAnnualMeans(dfStoredMeans, getAverageAnnual(
+                    incrementalResult['combined'], counties, years), incrementalResult['affected'])
+        if (dfAnnualMeans is None and useSqlEngine):
+            dfAnnualMeans = getAverageAnnualSql()
+            if (dfAnnualMeans is not None and useSourceCache and meansDbFingerprint == None):
+                meansDbFingerprint = pdsiPrecipFingerprint()
+        if (dfAnnualMeans is None and useStreamingEngine):
+            if (stateResult == None):
+                from streamingPipeline import streamAnnualMeans
+                stateResult = streamAnnualMeans(dfCounties, dfStates, years)
+            dfAnnualMeans = stateResult['annualMeans']
+        if (dfAnnualMeans is None and useParallelEngine):
+            if (stateResult == None):
+                from parallelPipeline import runStatePartitioned
+                stateResult = runStatePartitioned(
+                    dfDrought, dfRain, dfCounties, dfStates, years, computeWorkers)
+            dfAnnualMeans = stateResult['annualMeans']
+        if (dfAnnualMeans is None):
+            if (dfCombinedDroughtRainData is None):
+                # the sql query failed or an incremental run could not reuse the stored means,
+                # fall back to the pandas engine on the merged frame
+                print('Computing the annual means of the merged frame with pandas')
+                dfCombinedDroughtRainData = concatData(dfDrought, dfRain, dfStates)
+            dfAnnualMeans = getAverageAnnual(
+                dfCombinedDroughtRainData, counties, years)
+            if (pdsiPrecipInserted and useSourceCache):
+                meansDbFingerprint = pdsiPrecipFingerprint()
+        # year x county x metric array, year slices and county series are views without filtering
+        # the saved cube is memory mapped when it was built from the same annual means
+        annualCube = None
+        meansFingerprint = annualMeansFingerprint(dfAnnualMeans)
+        if (useSourceCache):
+            saveAnnualMeans(dfAnnualMeans, dbFingerprint=meansDbFingerprint)
+            annualCube = loadAnnualCube(fingerprint=meansFingerprint)
+        if (annualCube == None):
+            annualCube = buildAnnualCube(dfAnnualMeans)
+            if (useSourceCache):
+                saveAnnualCube(annualCube, fingerprint=meansFingerprint)
+
+        dfAnnualPrecipCombined = None
+        if (useSqlEngine):
+            dfAnnualPrecipCombined = annualPrecipCombinedSql(years)
+        if (dfAnnualPrecipCombined is None):
+            dfAnnualPrecipCombined = annualPrecipCombined(dfAnnualMeans, years)
 
         # get the thresholds for q1 and q3 along with IQR
         annualPdsiQuantile = dfAnnualMeans['pdsiAvg'].quantile(q=[0.25, 0.75])
         annualPrecipQuatile = dfAnnualMeans['precipAvg'].quantile(q=[
                                                                   0.25, 0.75])
+        periodQuantiles = None
+        if (quantilePeriod != 'all'):
+            periodQuantiles = groupedQuantiles(
+                dfAnnualMeans, quantilePeriod, ['pdsiAvg', 'precipAvg'], [0.25, 0.75])
 
         # get the correlation between pdsi and precipitation separated by year
-        corrByYear = annualPdsiPrecipCorr(dfCombinedDroughtRainData, years)
-        corrAvg = dfAnnualMeans.corr('pearson')['pdsiAvg']['precipAvg']
+        corrByYear = None
+        corrAvg = None
+        # pdsi_precip is current after an incremental update, its queries avoid the full merge
+        if (useSqlEngine or incrementalResult):
+            corrByYear = annualPdsiPrecipCorrSql(years)
+            corrAvg = annualMeansCorrSql()
+        # the sql queries return None when the database is unreachable, pandas computes them then
+        if (corrByYear is None or corrAvg is None):
+            if (useStreamingEngine or useParallelEngine):
+                if (stateResult == None and useStreamingEngine):
+                    from streamingPipeline import streamAnnualMeans
+                    stateResult = streamAnnualMeans(dfCounties, dfStates, years)
+                elif (stateResult == None):
+                    from parallelPipeline import runStatePartitioned
+                    stateResult = runStatePartitioned(
+                        dfDrought, dfRain, dfCounties, dfStates, years, computeWorkers)
+                corrByYear = stateResult['corrByYear']
+            else:
+                if (dfCombinedDroughtRainData is None):
+                    # the sql engine and incremental runs skipped the merged frame, build it now the queries failed
+                    dfCombinedDroughtRainData = concatData(dfDrought, dfRain, dfStates)
+                corrByYear = annualPdsiPrecipCorr(dfCombinedDroughtRainData, years)
+            corrAvg = dfAnnualMeans.corr('pearson')['pdsiAvg']['precipAvg']
         print(
             'Correlation PDSI and Precipitation all yearly averages: {0}'.format(corrAvg))
 
-        quartilePdsi = getAnnualQuantileCountyDatasetPdsi(
-            dfAnnualMeans, annualPdsiQuantile, annualPrecipQuatile)
-
-        quartilePrecip = getAnnualQuantileCountyDatasetPrecip(
-            dfAnnualMeans, annualPdsiQuantile, annualPrecipQuatile)
+        # q1 and q3 county years as masks of the cube instead of filtered copies of the frame
+        if (periodQuantiles == None):
+            quartilePdsi = quartileMasks(annualCube, 'pdsiAvg',
+                                         annualPdsiQuantile[0.25], annualPdsiQuantile[0.75])
+            quartilePrecip = quartileMasks(annualCube, 'precipAvg',
+                                           annualPrecipQuatile[0.25], annualPrecipQuatile[0.75])
+        else:
+            dfThresholds = periodQuantiles['thresholds']
+            quartilePdsi = quartileMasks(annualCube, 'pdsiAvg',
+                                         periodThresholds(annualCube, dfThresholds[quantileColumn('pdsiAvg', 0.25)], quantilePeriod),
+                                         periodThresholds(annualCube, dfThresholds[quantileColumn('pdsiAvg', 0.75)], quantilePeriod))
+            quartilePrecip = quartileMasks(annualCube, 'precipAvg',
+                                           periodThresholds(annualCube, dfThresholds[quantileColumn('precipAvg', 0.25)], quantilePeriod),
+                                           periodThresholds(annualCube, dfThresholds[quantileColumn('precipAvg', 0.75)], quantilePeriod))
 
         if (performQuartileVisualizations):
-            quartileVisualizations(quartilePdsi, quartilePrecip, years)
+            quartileVisualizations(annualCube, quartilePdsi, quartilePrecip, years)
 
         if (performLineVisualizations and corrAvg):
+            from visualization import lineChartPrecip, lineChartCorr
             lineChartPrecip(dfAnnualPrecipCombined, corrAvg, 'precipAvg')
             lineChartCorr(corrByYear, corrAvg, 'correlationPdsiPrecip')
 
         # Run visualizations
         if (performVisualizations):
             visualizations(dfDrought, dfCombinedDroughtRainData,
-                           dfAnnualMeans, years)
+                           dfAnnualMeans, years, renderWorkers, annualCube)
+
+        if (performQuartileVisualizations or performLineVisualizations or performVisualizations):
+            # wait for the chart files still being written
+            from figureExport import flushExports
+            flushExports()
 
     else:
         print('Could not process data further, failed cleaning process')
 
+    closeConnectionPool()
+
+    printSummary()
+    printCacheStats()
+    if (instrumentationReport):
+        writeReport(instrumentationReport, instrumentationFormat)
+
 
 if __name__ == "__main__":
     main()
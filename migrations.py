@@ -0,0 +1,237 @@
+# Schema migrations for the postgres tables: compact types, decade partitions, and indexes
+import json
+
+from databaseConnection import pooledConnection
+
+
+# one partition per decade from the 1890s to the 2020s, years outside go to the default partition
+partitionDecades = range(1890, 2030, 10)
+
+
+def migrateMeasurementsToReal(cur, tableName: str):
+    """Switch the unbounded numeric measurement columns to 4 byte real"""
+    columns = {'drought': ['pdsi'],
+               'pdsi_precip': ['pdsi', 'precip'],
+               'rain': ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+                        'jul', 'aug', 'sep', 'oct', 'nov', 'dec']}[tableName]
+    cur.execute('ALTER TABLE {0} {1};'.format(tableName, ', '.join(
+        ['ALTER COLUMN {0} TYPE real'.format(column) for column in columns])))
+
+
+def migratePartitionByDecade(cur, tableName: str):
+    """Rebuild a table as range partitioned by decade on year, keeping ids and rows"""
+    cur.execute(
+        "SELECT relkind FROM pg_class WHERE oid = %s::regclass;", (tableName,))
+    if (cur.fetchone()[0] == 'p'):
+        return
+
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id');", (tableName,))
+    idSequence = cur.fetchone()[0]
+    cur.execute('SELECT count(*) FROM {0};'.format(tableName))
+    sourceRows = cur.fetchone()[0]
+
+    newTable = '{0}_partitioned'.format(tableName)
+    cur.execute('CREATE TABLE {0} (LIKE {1} INCLUDING DEFAULTS) PARTITION BY RANGE (year);'.format(
+        newTable, tableName))
+    cur.execute('ALTER TABLE {0} ADD PRIMARY KEY (id, year);'.format(newTable))
+    for decade in partitionDecades:
+        cur.execute('CREATE TABLE {0}_{1}s PARTITION OF {2} FOR VALUES FROM ({1}) TO ({3});'.format(
+            tableName, decade, newTable, decade + 10))
+    cur.execute('CREATE TABLE {0}_default PARTITION OF {1} DEFAULT;'.format(
+        tableName, newTable))
+
+    cur.execute('INSERT INTO {0} SELECT * FROM {1};'.format(newTable, tableName))
+    cur.execute('SELECT count(*) FROM {0};'.format(newTable))
+    partitionedRows = cur.fetchone()[0]
+    if (partitionedRows != sourceRows):
+        raise Exception('{0} partitioned rows {1} do not match source rows {2}'.format(
+            tableName, partitionedRows, sourceRows))
+
+    # keep the id sequence alive when the unpartitioned table is dropped
+    cur.execute('ALTER SEQUENCE {0} OWNED BY NONE;'.format(idSequence))
+    cur.execute('DROP TABLE {0};'.format(tableName))
+    cur.execute('ALTER TABLE {0} RENAME TO {1};'.format(newTable, tableName))
+    cur.execute('ALTER SEQUENCE {0} OWNED BY {1}.id;'.format(
+        idSequence, tableName))
+
+
+def migrateAddIndexes(cur, tableName: str):
+    """Add the composite lookup indexes, created on every partition of partitioned tables"""
+    if (tableName == 'rain'):
+        cur.execute(
+            'CREATE INDEX IF NOT EXISTS rain_county_year_idx ON rain (state_id, county_id, year);')
+        return
+    cur.execute('CREATE INDEX IF NOT EXISTS {0}_county_year_month_idx ON {0} (county_fips, year, month);'.format(
+        tableName))
+    cur.execute(
+        'CREATE INDEX IF NOT EXISTS {0}_year_idx ON {0} (year);'.format(tableName))
+
+
+# ordered (version, description, tables, migration function) applied by migrateSchema
+schemaMigrations = [
+    ('001', 'measurements numeric -> real', ['drought', 'pdsi_precip', 'rain'],
+     migrateMeasurementsToReal),
+    ('002', 'range partition by decade', ['drought', 'pdsi_precip'],
+     migratePartitionByDecade),
+    ('003', 'county/year/month and year indexes', ['drought', 'pdsi_precip', 'rain'],
+     migrateAddIndexes)
+]
+
+
+def createMigrationsTable(cur):
+    """Create the table recording which migrations ran on which table
+
+    table_oid is the oid of the migrated table, a table dropped and created again (e.g. by
+    createTables) gets a new oid and its records no longer apply, see forgetRecreatedTables
+    """
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version varchar(8) NOT NULL,
+            table_name varchar(32) NOT NULL,
+            description varchar(64) NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now(),
+            table_oid oid,
+            PRIMARY KEY (version, table_name)
+        );''')
+    cur.execute('ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS table_oid oid;')
+
+
+def forgetRecreatedTables(cur):
+    """Drop the migration records of tables that were dropped or created again since they
+    were migrated, so migrateSchema runs the migrations on the new tables
+
+    Records from before table_oid was kept are taken to belong to the current table
+    """
+    cur.execute('UPDATE schema_migrations SET table_oid = to_regclass(table_name::text)::oid '
+                'WHERE table_oid IS NULL;')
+    cur.execute('DELETE FROM schema_migrations '
+                'WHERE table_oid IS DISTINCT FROM to_regclass(table_name::text)::oid;')
+    if (cur.rowcount > 0):
+        print('Cleared {0} migration records of recreated tables'.format(cur.rowcount))
+
+
+def recordMigration(cur, version: str, description: str, tableName: str):
+    """Record an applied migration and the oid of its table
+
+    Every record of the table is moved to the current oid, a migration that rebuilds and
+    swaps the table (migratePartitionByDecade) gives it a new one
+    """
+    cur.execute('INSERT INTO schema_migrations (version, table_name, description) VALUES (%s, %s, %s);',
+                (version, tableName, description))
+    cur.execute('UPDATE schema_migrations SET table_oid = to_regclass(%s)::oid WHERE table_name = %s;',
+                (tableName, tableName))
+
+
+def tableExists(cur, tableName: str):
+    cur.execute('SELECT to_regclass(%s);', (tableName,))
+    return cur.fetchone()[0] != None
+
+
+def explainQueries():
+    """Run EXPLAIN ANALYZE on typical county and year lookups
+
+    Parameters: None
+
+    Returns:
+    timings: dict - query description -> execution time in ms
+    """
+    queries = {
+        'pdsi_precip county year': ('SELECT avg(pdsi), avg(precip) FROM pdsi_precip WHERE county_fips = %(county)s AND year = %(year)s;'),
+        'pdsi_precip year': ('SELECT county_fips, avg(pdsi) FROM pdsi_precip WHERE year = %(year)s GROUP BY county_fips;'),
+        'drought county series': ('SELECT year, month, pdsi FROM drought WHERE county_fips = %(county)s ORDER BY year, month;'),
+        'drought decade': ('SELECT avg(pdsi) FROM drought WHERE year BETWEEN %(year)s AND %(year)s + 9;')
+    }
+    timings = {}
+    with pooledConnection() as conn:
+        if (conn == None):
+            return timings
+        cur = conn.cursor()
+        cur.execute('SELECT county_fips, year FROM pdsi_precip LIMIT 1;')
+        sample = cur.fetchone()
+        if (sample == None):
+            print('pdsi_precip is empty, nothing to benchmark')
+            cur.close()
+            return timings
+        params = {'county': sample[0], 'year': sample[1]}
+        for label, sql in queries.items():
+            cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+            plan = cur.fetchone()[0]
+            if (isinstance(plan, str)):
+                plan = json.loads(plan)
+            timings[label] = plan[0]['Execution Time']
+            print('{0}: {1:.2f} ms ({2})'.format(
+                label, timings[label], plan[0]['Plan']['Node Type']))
+        cur.close()
+    return timings
+
+
+def migrateSchema(benchmark: bool = True):
+    """Apply every pending migration, each table migration in its own transaction
+
+    Parameters:
+    benchmark?: bool - print EXPLAIN ANALYZE timings of typical queries before and after
+
+    Returns:
+    bool - all pending migrations applied
+    """
+    with pooledConnection() as conn:
+        if (conn == None):
+            print('No database connection')
+            return False
+        cur = conn.cursor()
+        createMigrationsTable(cur)
+        forgetRecreatedTables(cur)
+        conn.commit()
+        pending = []
+        for version, description, tables, migration in schemaMigrations:
+            for tableName in tables:
+                cur.execute('SELECT 1 FROM schema_migrations WHERE version = %s AND table_name = %s;',
+                            (version, tableName))
+                if (cur.fetchone() == None and tableExists(cur, tableName)):
+                    pending.append((version, description, tableName, migration))
+        cur.close()
+
+    if (not pending):
+        print('Database schema is up to date')
+        return True
+
+    print('Starting Schema Migration ========================')
+    if (benchmark):
+        print('Query timings before migration:')
+        before = explainQueries()
+
+    with pooledConnection() as conn:
+        if (conn == None):
+            print('No database connection')
+            return False
+        cur = conn.cursor()
+        for version, description, tableName, migration in pending:
+            try:
+                migration(cur, tableName)
+                recordMigration(cur, version, description, tableName)
+                conn.commit()
+            except Exception as err:
+                print('--- Failed migration {0} ({1}) on {2} ---'.format(
+                    version, description, tableName))
+                print(err)
+                conn.rollback()
+                cur.close()
+                return False
+            else:
+                print('--- Applied migration {0} ({1}) on {2} ---'.format(
+                    version, description, tableName))
+        for tableName in sorted({tableName for _, _, tableName, _ in pending}):
+            cur.execute('ANALYZE {0};'.format(tableName))
+        conn.commit()
+        cur.close()
+
+    if (benchmark):
+        print('Query timings after migration:')
+        after = explainQueries()
+        for label in after:
+            if (label in before and after[label]):
+                print('{0}: {1:.1f}x faster'.format(
+                    label, before[label] / after[label]))
+
+    print('Finished Schema Migration ========================')
+    return True
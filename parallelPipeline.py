@@ -0,0 +1,125 @@
+# Clean, merge, and annual aggregate stages run per state in a process pool
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import time
+
+import pandas as pd
+
+from dataClean import cleanFips
+from dataTypes import compactDtypes
+from groupedStats import momentColumns, corrByYearFromMoments
+from instrumentation import records, recordsSince, mergeRecords
+from streamingPipeline import annualMeansDtypes, processStatePartition
+
+
+def partitionByState(dfDrought: pd.DataFrame, dfRain: pd.DataFrame, dfStates: pd.DataFrame):
+    """Split the drought and rain frames by state fips
+
+    Rain rows are keyed by NOAA state code and mapped to fips through dfStates
+
+    Parameters:
+    dfDrought: pd.DataFrame - cleaned drought data
+    dfRain: pd.DataFrame - cleaned rain data
+    dfStates: pd.DataFrame - state data
+
+    Returns:
+    partitions: list - (state fips, dfDrought, dfRain) for every state with drought data
+    """
+    noaaToFips = dict(zip(dfStates['noaa_state_fips'], dfStates['state_fips']))
+    rainByState = dict(list(dfRain.groupby(dfRain['state_id'].map(noaaToFips), sort=False)))
+    emptyRain = dfRain.iloc[0:0]
+
+    partitions = []
+    for state, dfStateDrought in dfDrought.groupby('statefips', sort=True):
+        partitions.append((state, dfStateDrought, rainByState.get(state, emptyRain)))
+    return partitions
+
+
+def cleanMergeAggregate(dfDrought: pd.DataFrame, dfRain: pd.DataFrame, dfCounties: pd.DataFrame,
+                        dfStates: pd.DataFrame):
+    """Run the clean, merge, and annual aggregate stages on one state partition
+
+    A drought row only joins the state and counties of its own fips, so the fips errors of
+    the partitions add up to those of the whole frame
+
+    Parameters:
+    dfDrought: pd.DataFrame - drought rows of the state
+    dfRain: pd.DataFrame - rain rows of the state
+    dfCounties: pd.DataFrame - county data
+    dfStates: pd.DataFrame - state data
+
+    Returns:
+    result: dict - 'annualMeans', 'moments' (see processStatePartition), 'stateErrors',
+        'countyErrors' (see cleanFips), 'rows', 'seconds', 'records': stages recorded by the
+        partition, see instrumentation.recordsSince
+    """
+    mark = len(records)
+    startTime = time.perf_counter()
+    doesNotInclude = cleanFips(dfDrought, dfCounties, dfStates, verbose=False)
+    result = processStatePartition(dfDrought.copy(), dfRain, dfStates)
+    result.update({'stateErrors': doesNotInclude['stateErrors'],
+                   'countyErrors': doesNotInclude['countyErrors'],
+                   'rows': len(dfDrought.index), 'seconds': time.perf_counter() - startTime,
+                   'records': recordsSince(mark)})
+    return result
+
+
+def runStatePartitioned(dfDrought: pd.DataFrame, dfRain: pd.DataFrame, dfCounties: pd.DataFrame,
+                        dfStates: pd.DataFrame, years=None, workers: int = 4):
+    """Annual means and per year correlation with every state cleaned, merged, and
+    aggregated in a worker process
+
+    Parameters:
+    dfDrought: pd.DataFrame - cleaned drought data
+    dfRain: pd.DataFrame - cleaned rain data
+    dfCounties: pd.DataFrame - county data
+    dfStates: pd.DataFrame - state data
+    years?: int[] - years reported in corrByYear, default every year with data
+    workers?: int - worker processes, 1 runs every partition in this process
+
+    Returns:
+    result: dict - 'annualMeans': same frame as aggregation.getAverageAnnual, 'corrByYear': year,
+        corrCoeff like aggregation.annualPdsiPrecipCorr, 'stateErrors', 'countyErrors' summed over
+        the states, see cleanFips
+    """
+    print('Processing States In Parallel ({0} workers) ========================'.format(workers))
+    startTime = time.perf_counter()
+    partitions = partitionByState(dfDrought, dfRain, dfStates)
+
+    results = {}
+    if (workers <= 1):
+        for state, dfStateDrought, dfStateRain in partitions:
+            results[state] = cleanMergeAggregate(dfStateDrought, dfStateRain, dfCounties, dfStates)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(cleanMergeAggregate, dfStateDrought, dfStateRain,
+                                       dfCounties, dfStates): state
+                       for state, dfStateDrought, dfStateRain in partitions}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                # the stages of the worker processes are only in their results
+                mergeRecords(results[futures[future]]['records'])
+
+    states = sorted(results)
+    if (states):
+        dfAnnualMeans = pd.concat([results[state]['annualMeans'].astype(
+            {'countyFips': str, 'stateFips': str}) for state in states])
+        dfMoments = results[states[0]]['moments']
+        for state in states[1:]:
+            dfMoments = dfMoments.add(results[state]['moments'], fill_value=0)
+    else:
+        # no drought rows, nothing to aggregate
+        dfAnnualMeans = pd.DataFrame({column: pd.Series(dtype=dtype)
+                                      for column, dtype in annualMeansDtypes.items()})
+        dfMoments = pd.DataFrame(columns=momentColumns)
+    dfAnnualMeans = dfAnnualMeans.sort_values(['countyFips', 'year']).reset_index(drop=True)
+    dfAnnualMeans = compactDtypes(dfAnnualMeans, 'Parallel Annual Means')
+
+    stateErrors = sum(results[state]['stateErrors'] for state in states)
+    countyErrors = sum(results[state]['countyErrors'] for state in states)
+    print('Invalid states: {0}'.format(stateErrors))
+    print('Invalid counties: {0}'.format(countyErrors))
+    print('Processed {0} states in {1:.2f}s'.format(
+        len(states), time.perf_counter() - startTime))
+
+    return {'annualMeans': dfAnnualMeans, 'corrByYear': corrByYearFromMoments(dfMoments, years),
+            'stateErrors': stateErrors, 'countyErrors': countyErrors}
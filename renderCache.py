@@ -0,0 +1,132 @@
+# Skip re-rendering figures whose data and layout did not change since the last export
+import hashlib
+import json
+import os
+import threading
+
+
+# the exports check the cache while this is True, see setRenderCacheEnabled
+cacheEnabled = True
+# reused, rendered, and failed exports of this process, see cacheStats
+# renders are recorded by the writer threads once their file is written
+stats = {'hits': 0, 'rendered': 0, 'failed': 0}
+statsLock = threading.Lock()
+
+
+def setRenderCacheEnabled(enabled: bool):
+    """Turn the render cache on or off, off re-renders and re-records every figure"""
+    global cacheEnabled
+    cacheEnabled = enabled
+
+
+def figureSpecHash(figure, options: dict = None):
+    """Hash the data and layout of a figure plus the export options
+
+    Parameters:
+    figure: plotly.graph_objects - plot object
+    options?: dict - export settings that change the output, e.g. format, width, height
+
+    Returns:
+    str - sha256 hex digest
+    """
+    return specJsonHash(figure.to_json(), options)
+
+
+def specJsonHash(specJson: str, options: dict = None):
+    """figureSpecHash of an already serialized figure
+
+    Parameters:
+    specJson: str - figure json, as plotly.io.to_json
+    options?: dict - export settings that change the output
+
+    Returns:
+    str - sha256 hex digest
+    """
+    # plotly is only loaded when a figure is hashed, data only runs never import it
+    import plotly
+
+    sha = hashlib.sha256(specJson.encode())
+    sha.update(json.dumps(options or {}, sort_keys=True, default=str).encode())
+    # a new plotly version can render the same spec differently
+    sha.update(plotly.__version__.encode())
+    return sha.hexdigest()
+
+
+def sidecarPath(path: str):
+    """Hash file of an exported artifact, kept in a hidden .renderCache next to it"""
+    directory, fileName = os.path.split(path)
+    return os.path.join(directory, '.renderCache', fileName + '.sha256')
+
+
+def countStat(name: str):
+    """Add one to a render cache stat, safe from the writer threads"""
+    with statsLock:
+        stats[name] += 1
+
+
+def isUpToDate(path: str, specHash: str):
+    """Check an artifact exists and was rendered from the same spec, counting the hit
+
+    A miss is only counted once the export is written (recordRender) or failed (recordFailure)
+
+    Parameters:
+    path: str - artifact location
+    specHash: str - figureSpecHash of the figure about to be exported
+
+    Returns:
+    bool - the artifact can be reused
+    """
+    if (not cacheEnabled):
+        return False
+    upToDate = False
+    if (os.path.exists(path) and os.path.exists(sidecarPath(path))):
+        with open(sidecarPath(path)) as f:
+            upToDate = f.read().strip() == specHash
+    if (upToDate):
+        countStat('hits')
+    return upToDate
+
+
+def recordRender(path: str, specHash: str):
+    """Store the spec hash of an artifact after its file was written and count the render"""
+    countStat('rendered')
+    try:
+        os.makedirs(os.path.dirname(sidecarPath(path)), exist_ok=True)
+        with open(sidecarPath(path), 'w') as f:
+            f.write(specHash)
+    except Exception as err:
+        print('Could not record render cache entry for {0}: {1}'.format(path, err))
+
+
+def recordFailure(path: str):
+    """Count an export that could not be rendered or written, its hash is not recorded"""
+    countStat('failed')
+
+
+def cacheStats():
+    """Reused, rendered, and failed exports and hit rate of the render cache in this process
+
+    Returns:
+    stats: dict - 'hits', 'rendered', 'failed', 'hitRate' (None before any export)
+    """
+    with statsLock:
+        current = dict(stats)
+    exports = current['hits'] + current['rendered'] + current['failed']
+    current['hitRate'] = current['hits'] / exports if exports else None
+    return current
+
+
+def mergeCacheStats(workerStats: dict):
+    """Add the stats counted in a worker process to this process"""
+    with statsLock:
+        for name in stats:
+            stats[name] += workerStats.get(name, 0)
+
+
+def printCacheStats():
+    """Print the render cache hit rate, nothing when no figure was exported"""
+    current = cacheStats()
+    if (current['hitRate'] == None):
+        return
+    print('Render cache: {0} reused, {1} rendered, {2} failed ({3:.0%} hit rate)'.format(
+        current['hits'], current['rendered'], current['failed'], current['hitRate']))
@@ -0,0 +1,112 @@
+# Annual means and correlations computed in PostgreSQL from the pdsi_precip table
+import pandas as pd
+
+from dataClean import readTable
+from dataTypes import compactDtypes
+
+
+# getAverageAnnual stat name -> PostgreSQL aggregate
+sqlAggregates = {'min': 'min', 'max': 'max', 'std': 'stddev_samp',
+                 'var': 'var_samp', 'count': 'count', 'sum': 'sum'}
+
+# NaN measurements (no rainfall match) are skipped like pandas does
+annualMeansSql = '''
+    SELECT county_fips, year,
+        round(avg(NULLIF(pdsi, 'NaN'))::numeric, 2) AS pdsi_avg,
+        round(avg(NULLIF(precip, 'NaN'))::numeric, 2) AS precip_avg
+    FROM pdsi_precip
+    GROUP BY county_fips, year'''
+
+
+def getAverageAnnualSql(stats: list = None):
+    """get the annual PDSI and precip average by county, aggregated in the database
+
+    Parameters:
+    stats?: list - extra aggregations for pdsi and precip ('min', 'max', 'std', 'count', ...)
+
+    Returns:
+    dfAnnualMeans: pd.DataFrame - same columns as aggregation.getAverageAnnual
+    """
+    print('Calculating Averages Consolidated Annually (SQL) ========================')
+    columns = ['min(state_fips) AS "stateFips"',
+               'round(avg(NULLIF(pdsi, \'NaN\'))::numeric, 2) AS "pdsiAvg"',
+               'round(avg(NULLIF(precip, \'NaN\'))::numeric, 2) AS "precipAvg"']
+    for stat in (stats or []):
+        for column in ('pdsi', 'precip'):
+            if (stat == 'median'):
+                aggregate = 'percentile_cont(0.5) WITHIN GROUP (ORDER BY NULLIF({0}, \'NaN\'))'.format(
+                    column)
+            else:
+                aggregate = '{0}(NULLIF({1}, \'NaN\'))'.format(
+                    sqlAggregates[stat], column)
+            if (stat != 'count'):
+                aggregate = 'round(({0})::numeric, 2)'.format(aggregate)
+            columns.append('{0} AS "{1}{2}"'.format(
+                aggregate, column, stat.capitalize()))
+
+    dfAnnualMeans = readTable('''
+        SELECT year, county_fips AS "countyFips", {0}
+        FROM pdsi_precip
+        GROUP BY county_fips, year
+        ORDER BY county_fips, year'''.format(', '.join(columns)),
+        {'countyFips': str, 'stateFips': str})
+    if (dfAnnualMeans is None):
+        return None
+    return compactDtypes(dfAnnualMeans, 'Annual Means')
+
+
+def annualPrecipCombinedSql(years):
+    """Mean and median of the county annual precip averages for each year, in the database
+
+    Parameters:
+    years: int[] - years to keep
+
+    Returns:
+    dfAnnualPrecipCombined: pd.DataFrame - year, precipAvg, precipMedian
+    """
+    df = readTable('''
+        WITH annual AS ({0})
+        SELECT year, avg(precip_avg) AS "precipAvg",
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY precip_avg) AS "precipMedian"
+        FROM annual
+        GROUP BY year
+        ORDER BY year'''.format(annualMeansSql))
+    if (df is None):
+        return None
+    df = df.loc[df['year'].isin(years) & (df['precipAvg'] != 0) & (df['precipMedian'] != 0)]
+    return df.reset_index(drop=True)
+
+
+def annualPdsiPrecipCorrSql(years):
+    """Pearson correlation of monthly pdsi and precip for each year, in the database
+
+    Parameters:
+    years: int[] - years to keep
+
+    Returns:
+    dfCorrCoeff: pd.DataFrame - year, corrCoeff
+    """
+    df = readTable('''
+        SELECT year, corr(NULLIF(pdsi, 'NaN'), NULLIF(precip, 'NaN')) AS "corrCoeff"
+        FROM pdsi_precip
+        GROUP BY year
+        ORDER BY year''')
+    if (df is None):
+        return None
+    df = df.loc[df['year'].isin(years) & (df['corrCoeff'] != 0)]
+    return df.reset_index(drop=True)
+
+
+def annualMeansCorrSql():
+    """Pearson correlation of the county annual pdsi and precip averages, in the database
+
+    Returns:
+    float - correlation coefficient, None when the query fails
+    """
+    df = readTable('''
+        WITH annual AS ({0})
+        SELECT corr(pdsi_avg, precip_avg) AS "corrAvg"
+        FROM annual'''.format(annualMeansSql))
+    if (df is None):
+        return None
+    return df['corrAvg'].iloc[0]
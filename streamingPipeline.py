@@ -0,0 +1,195 @@
+# Streaming pipeline: sources are read in chunks, spilled by state, and aggregated one state at a time
+import os
+import shutil
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from aggregation import getAverageAnnual
+from dataCache import sourceFiles
+from dataClean import cleanFips, cleanFipsCols, parseClimdivData
+from dataTypes import monthColumns, compactDtypes
+from groupedStats import momentColumns, correlationMoments, corrByYearFromMoments
+from machineLearning import concatData
+
+
+# dtypes of the spill files, fips stay strings so the leading zeros survive
+droughtSpillDtypes = {'year': 'int16', 'month': 'int8', 'statefips': str,
+                      'countyfips': str, 'pdsi': 'float32'}
+rainSpillDtypes = {'state_id': str, 'county_id': str, 'year': 'int16',
+                   **{month: 'float32' for month in monthColumns}}
+# columns of aggregation.getAverageAnnual, used for the result of a run without any state
+annualMeansDtypes = {'year': 'int16', 'countyFips': str, 'stateFips': str,
+                     'pdsiAvg': 'float32', 'precipAvg': 'float32'}
+
+
+def appendSpill(df: pd.DataFrame, path: str):
+    """Append rows to a spill csv, writing the header when the file is new"""
+    df.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+
+def partitionSources(droughtPath: str, rainPath: str, dfStates: pd.DataFrame, spillDir: str,
+                     chunkSize: int = 500000):
+    """Read the drought and rain sources in chunks and spill the rows to one csv per state
+
+    Parameters:
+    droughtPath: str - drought csv location
+    rainPath: str - climdiv precipitation csv location
+    dfStates: pd.DataFrame - state data, maps the NOAA state codes of the rain data to fips
+    spillDir: str - directory for the per state files, emptied first
+    chunkSize?: int - rows read at a time
+
+    Returns:
+    partitions: dict - 'states': state fips with drought data, in order, 'years' and
+        'counties': drought years and county fips in order of appearance, like unique()
+        on the whole drought frame
+    """
+    for partition in ['drought', 'rain']:
+        shutil.rmtree(os.path.join(spillDir, partition), ignore_errors=True)
+        os.makedirs(os.path.join(spillDir, partition))
+
+    droughtRows = 0
+    chunkYears = []
+    chunkCounties = []
+    for chunk in pd.read_csv(droughtPath, chunksize=chunkSize,
+                             dtype={'countyfips': str, 'statefips': str}):
+        chunk = cleanFipsCols(chunk, 'countyfips', 5)
+        chunk = cleanFipsCols(chunk, 'statefips', 2)
+        for state, dfState in chunk.groupby('statefips', sort=False):
+            appendSpill(dfState[list(droughtSpillDtypes)],
+                        os.path.join(spillDir, 'drought', state + '.csv'))
+        chunkYears.append(chunk['year'].astype(droughtSpillDtypes['year']).unique())
+        chunkCounties.append(chunk['countyfips'].unique())
+        droughtRows += len(chunk.index)
+
+    noaaToFips = dict(zip(dfStates['noaa_state_fips'], dfStates['state_fips']))
+    rainRows = 0
+    for chunk in pd.read_csv(rainPath, chunksize=chunkSize, dtype={'id_code': str}):
+        chunk = cleanFipsCols(chunk, 'id_code', 11)
+        dfRain = parseClimdivData(chunk, ['01']).get('01')
+        if (dfRain is None):
+            continue
+        # rain rows of unknown NOAA states never match drought rows, see concatData
+        stateFips = dfRain['state_id'].map(noaaToFips)
+        for state, dfState in dfRain.groupby(stateFips, sort=False):
+            appendSpill(dfState, os.path.join(spillDir, 'rain', state + '.csv'))
+        rainRows += len(dfRain.index)
+
+    states = sorted(fileName[:-len('.csv')]
+                    for fileName in os.listdir(os.path.join(spillDir, 'drought')))
+    print('Partitioned {0} drought and {1} rain rows into {2} states'.format(
+        droughtRows, rainRows, len(states)))
+    # the first appearances of the chunks in order are those of the whole file
+    years = pd.unique(np.concatenate(chunkYears)) if chunkYears else np.array([], dtype='int16')
+    counties = pd.unique(np.concatenate(chunkCounties)) if chunkCounties else np.array([], dtype=object)
+    return {'states': states, 'years': years, 'counties': counties}
+
+
+def processStatePartition(dfDrought: pd.DataFrame, dfRain: pd.DataFrame, dfStates: pd.DataFrame):
+    """Merge and aggregate the data of one state
+
+    Parameters:
+    dfDrought: pd.DataFrame - drought rows of the state
+    dfRain: pd.DataFrame - rain rows of the state
+    dfStates: pd.DataFrame - state data
+
+    Returns:
+    result: dict - 'annualMeans': annual means by county, 'moments': pdsi/precip
+        correlation moments by year
+    """
+    dfCombined = concatData(dfDrought, dfRain, dfStates)
+    return {'annualMeans': getAverageAnnual(dfCombined, None, None),
+            'moments': correlationMoments(dfCombined, 'year', 'pdsi', 'rainfall')}
+
+
+def streamAnnualMeans(dfCounties: pd.DataFrame, dfStates: pd.DataFrame, years=None,
+                      sources: dict = None, spillDir: str = 'sourceData/cache/stream',
+                      chunkSize: int = 500000, measureMemory: bool = False):
+    """Annual means and per year correlation computed state by state from the source csvs
+    The drought and rain csvs are only read in chunks, only one state of drought, rain, and
+    merged data is held in memory at a time, partial annual means are spilled to disk and
+    combined at the end. Each state is fips checked before it is merged, see cleanFips
+
+    Parameters:
+    dfCounties: pd.DataFrame - county data
+    dfStates: pd.DataFrame - state data
+    years?: int[] - years reported in corrByYear, default every drought year in order of appearance
+    sources?: dict - source name -> csv path, default dataCache.sourceFiles
+    spillDir?: str - directory for the spill files
+    chunkSize?: int - rows read at a time from the sources
+    measureMemory?: bool - trace the peak memory allocated by the pipeline, tracemalloc slows
+        every allocation so it is meant for benchmarks
+
+    Returns:
+    result: dict - 'annualMeans': same frame as aggregation.getAverageAnnual, 'corrByYear':
+        year, corrCoeff like aggregation.annualPdsiPrecipCorr, 'years' and 'counties' of the drought
+        source like unique() on the drought frame, 'stateErrors' and 'countyErrors' summed
+        over the states, 'peakMemoryMB': traced peak or None
+    """
+    print('Streaming Annual Means By State ========================')
+    sources = sources or sourceFiles
+    startTime = time.perf_counter()
+    if (measureMemory):
+        tracemalloc.start()
+
+    try:
+        partitions = partitionSources(sources['drought'], sources['rain'], dfStates,
+                                      spillDir, chunkSize)
+        states = partitions['states']
+        if (years is None):
+            years = partitions['years']
+        meansDir = os.path.join(spillDir, 'annualMeans')
+        shutil.rmtree(meansDir, ignore_errors=True)
+        os.makedirs(meansDir)
+
+        dfMoments = None
+        stateErrors = 0
+        countyErrors = 0
+        for state in states:
+            dfDrought = pd.read_csv(os.path.join(spillDir, 'drought', state + '.csv'),
+                                    dtype=droughtSpillDtypes)
+            rainPath = os.path.join(spillDir, 'rain', state + '.csv')
+            if (os.path.exists(rainPath)):
+                dfRain = pd.read_csv(rainPath, dtype=rainSpillDtypes)
+            else:
+                dfRain = pd.DataFrame({column: pd.Series(dtype=dtype)
+                                       for column, dtype in rainSpillDtypes.items()})
+            # a drought row only joins the state and counties of its own fips
+            doesNotInclude = cleanFips(dfDrought, dfCounties, dfStates, verbose=False)
+            stateErrors += doesNotInclude['stateErrors']
+            countyErrors += doesNotInclude['countyErrors']
+            result = processStatePartition(dfDrought, dfRain, dfStates)
+            appendSpill(result['annualMeans'], os.path.join(meansDir, state + '.csv'))
+            dfMoments = result['moments'] if dfMoments is None else dfMoments.add(
+                result['moments'], fill_value=0)
+
+        meansFrames = [pd.read_csv(os.path.join(meansDir, state + '.csv'),
+                                   dtype={'countyFips': str, 'stateFips': str})
+                       for state in states if os.path.exists(os.path.join(meansDir, state + '.csv'))]
+        if (meansFrames):
+            dfAnnualMeans = pd.concat(meansFrames)
+        else:
+            # no state had drought data, e.g. an empty dfStates or source
+            dfAnnualMeans = pd.DataFrame({column: pd.Series(dtype=dtype)
+                                          for column, dtype in annualMeansDtypes.items()})
+        dfAnnualMeans = dfAnnualMeans.sort_values(['countyFips', 'year']).reset_index(drop=True)
+        dfAnnualMeans = compactDtypes(dfAnnualMeans, 'Streamed Annual Means')
+
+        dfCorrCoeff = corrByYearFromMoments(dfMoments if dfMoments is not None else
+                                            pd.DataFrame(columns=momentColumns), years)
+    finally:
+        peakMemoryMB = None
+        if (measureMemory):
+            peakMemoryMB = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            tracemalloc.stop()
+
+    print('Invalid states: {0}'.format(stateErrors))
+    print('Invalid counties: {0}'.format(countyErrors))
+    print('Streamed {0} states in {1:.2f}s{2}'.format(
+        len(states), time.perf_counter() - startTime,
+        '' if peakMemoryMB is None else ', peak traced memory {0:.1f} MB'.format(peakMemoryMB)))
+    return {'annualMeans': dfAnnualMeans, 'corrByYear': dfCorrCoeff,
+            'years': partitions['years'], 'counties': partitions['counties'],
+            'stateErrors': stateErrors, 'countyErrors': countyErrors, 'peakMemoryMB': peakMemoryMB}
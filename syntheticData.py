@@ -0,0 +1,82 @@
+# Synthetic drought, climdiv, county, and state sources at a configurable scale for benchmarks
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataTypes import monthColumns
+
+
+def generateSyntheticSources(outDir: str = 'sourceData/synthetic', counties: int = 3000,
+                             years: int = 120, states: int = 50, startYear: int = 1895,
+                             extraElements: list = None, seed: int = 0):
+    """Write drought, climdiv, county, and state csvs in the layout of the NOAA sources
+
+    fips are written without leading zeros like the drought source so the cleaning steps
+    have the same work to do, extraElements adds climdiv rows the rain cleaning filters out
+
+    Parameters:
+    outDir?: str - directory for the csv files
+    counties?: int - number of counties, spread evenly over the states
+    years?: int - number of years of monthly data from startYear
+    states?: int - number of states, at most 99
+    startYear?: int - first year of data
+    extraElements?: list - climdiv element codes written next to '01' precipitation,
+        default ['02', '05'], [] writes only precipitation
+    seed?: int - random seed
+
+    Returns:
+    sources: dict - source name -> csv path, same keys as dataCache.sourceFiles
+    """
+    extraElements = ['02', '05'] if extraElements == None else extraElements
+    rng = np.random.default_rng(seed)
+    os.makedirs(outDir, exist_ok=True)
+    sources = {'drought': os.path.join(outDir, 'drought.csv'),
+               'counties': os.path.join(outDir, 'counties.csv'),
+               'states': os.path.join(outDir, 'states.csv'),
+               'rain': os.path.join(outDir, 'climdiv-pcpncy-synthetic.csv')}
+
+    stateFips = np.arange(1, states + 1)
+    dfStates = pd.DataFrame({'state_name': ['State {0}'.format(fips) for fips in stateFips],
+                             'postal': ['S{0}'.format(fips % 10) for fips in stateFips],
+                             'state_fips': stateFips,
+                             # NOAA numbers the states in its own order
+                             'noaa_state_fips': rng.permutation(states) + 1})
+    dfStates.to_csv(sources['states'], index=False)
+
+    countyState = stateFips[np.arange(counties) % states]
+    countyCode = np.arange(counties) // states * 2 + 1
+    countyFips = countyState * 1000 + countyCode
+    pd.DataFrame({'county_fips': countyFips,
+                  'county_name': ['County {0}'.format(fips) for fips in countyFips]}).to_csv(
+        sources['counties'], index=False)
+
+    # one row per county, year, and month, pdsi drifts slowly around 0
+    yearValues = np.arange(startYear, startYear + years)
+    rows = counties * years * 12
+    pdsi = np.cumsum(rng.normal(0, 0.5, (counties, years * 12)), axis=1)
+    pdsi = np.clip(pdsi - pdsi.mean(axis=1, keepdims=True), -10, 10).round(2)
+    pd.DataFrame({'year': np.tile(np.repeat(yearValues, 12), counties),
+                  'month': np.tile(np.arange(1, 13), counties * years),
+                  'statefips': np.repeat(countyState, years * 12),
+                  'countyfips': np.repeat(countyFips, years * 12),
+                  'pdsi': pdsi.reshape(rows)}).to_csv(sources['drought'], index=False)
+
+    # climdiv rows keyed by NOAA state code + county + element + year
+    noaaCodes = dfStates.set_index('state_fips')['noaa_state_fips']
+    frames = []
+    for element in ['01'] + list(extraElements):
+        idCodes = ['{0:02d}{1:03d}{2}{3}'.format(noaa, county, element, year)
+                   for noaa, county in zip(noaaCodes.loc[countyState].to_numpy(), countyCode)
+                   for year in yearValues]
+        values = rng.gamma(2.0, 1.5, (len(idCodes), 12)).round(2)
+        frames.append(pd.DataFrame(values, columns=range(12)).assign(id_code=idCodes))
+    dfRain = pd.concat(frames, ignore_index=True)
+    dfRain = dfRain[['id_code'] + list(range(12))]
+    # ids are written without the leading zero of the NOAA code, as in the source file
+    dfRain['id_code'] = dfRain['id_code'].str.lstrip('0')
+    dfRain.to_csv(sources['rain'], index=False)
+
+    print('Generated synthetic sources in {0}: {1} counties x {2} years ({3} drought rows, {4} climdiv rows)'.format(
+        outDir, counties, years, rows, len(dfRain.index)))
+    return sources
@@ -1,4 +1,6 @@
 import json
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
@@ -7,13 +9,32 @@ import plotly
 import plotly.express as px
 import os
 import matplotlib.pyplot as plt
-from dataClean import getGeoData
+from geometry import getSimplifiedGeoData
 from machineLearning import kNearestNeighborModels
+from groupedStats import yearlySummary
+from annualCube import buildAnnualCube, yearFrame, cubeYearlySummary
+from instrumentation import instrumented, records, recordsSince, mergeRecords
+from renderCache import cacheStats, mergeCacheStats
+from figureExport import exportFigure, flushExports, takeExportErrors
 
 
-counties = getGeoData()
+# simplified and quantized county polygons, loaded on first use by getCounties
+counties = None
 
 
+def getCounties():
+    """Get the county GeoJSON, loading and simplifying it on the first call
+
+    Returns:
+    counties: dict - simplified GeoJSON FeatureCollection
+    """
+    global counties
+    if (counties == None):
+        counties = getSimplifiedGeoData()
+    return counties
+
+
+@instrumented(category='export')
 def exportMatplotPNG(figure: plt, fileName: str, exportDir: str = 'visualizations/png'):
     figure.savefig(exportDir + '/' + fileName + '.png')
 
@@ -27,18 +48,9 @@ def exportPlotlySVG(figure: plotly.graph_objects, fileName: str, exportDir: str
     fileName: str - name of export svg not including .svg
     exportDir?: str - directory for export (default=visualizations)
 
-    Return: None
+    Return: bool - figure was exported
     """
-    if (os.path.exists(exportDir)):
-        try:
-            figure.write_image(exportDir + '/' + fileName + '.svg')
-        except Exception as err:
-            print('Could not export plotly svg: {0}'.format(err))
-        else:
-            print('Exported Plotly {0}/{1}.svg'.format(exportDir, fileName))
-    else:
-        print(
-            'Directory "{0} was not found for exporting plot"'.format(exportDir))
+    return exportFigure(figure, fileName, ['svg'], {'svg': exportDir})['svg']
 
 
 def exportPlotlyPNG(figure: plotly.graph_objects, fileName: str, exportDir: str = 'visualizations/png'):
@@ -50,21 +62,9 @@ def exportPlotlyPNG(figure: plotly.graph_objects, fileName: str, exportDir: str
     fileName: str - name of export png not including .png
     exportDir?: str - directory for export (default=visualizations)
 
-    Return: None
+    Return: bool - figure was exported
     """
-    if (os.path.exists(exportDir)):
-        try:
-            figure.write_image(exportDir + '/' + fileName +
-                               '.png', width=1024, height=768)
-        except Exception as err:
-            print('Could not export plotly png: {0}'.format(err))
-        else:
-            print('Exported Plotly {0}/{1}.png'.format(exportDir, fileName))
-    else:
-        print(
-            'Directory "{0} was not found for exporting plot"'.format(
-                exportDir)
-        )
+    return exportFigure(figure, fileName, ['png'], {'png': exportDir})['png']
 
 
 def exportPlotlyHTML(figure: plotly.graph_objects, fileName: str, exportDir: str = 'visualizations/html'):
@@ -76,22 +76,9 @@ def exportPlotlyHTML(figure: plotly.graph_objects, fileName: str, exportDir: str
     fileName: str - name of export html not including .html
     exportDir?: str - directory for export (default=visualizations)
 
-    Return: None
+    Return: bool - figure was exported
     """
-    if (os.path.exists(exportDir)):
-        try:
-            figure.write_html(exportDir + '/' + fileName + '.html', config=dict(
-                displayModeBar=False
-            ))
-        except Exception as err:
-            print('Could not export plotly html: {0}'.format(err))
-        else:
-            print('Exported Plotly {0}/{1}.html'.format(exportDir, fileName))
-    else:
-        print(
-            'Directory "{0} was not found for exporting plot"'.format(
-                exportDir)
-        )
+    return exportFigure(figure, fileName, ['html'], {'html': exportDir})['html']
 
 
 def generateScatterPlot(df, title: str):
@@ -118,7 +105,7 @@ def genCountyChartTimeline(dfDrought):
     """
     df = dfDrought.loc[dfDrought['year'] >= 1960]
     # df = dfDrought
-    fig = px.choropleth(df, geojson=counties, locations='countyfips', color='pdsi',
+    fig = px.choropleth(df, geojson=getCounties(), locations='countyfips', color='pdsi',
                         color_continuous_scale='Viridis_r',
                         animation_frame='year',
                         range_color=(10, -10),
@@ -142,7 +129,7 @@ def genCountyChart(dfDrought, name: str):
     """
     # df = dfDrought.loc[dfDrought['year'] >= 1960]
     df = dfDrought
-    fig = px.choropleth(df, geojson=counties, locations='countyfips', color='pdsi',
+    fig = px.choropleth(df, geojson=getCounties(), locations='countyfips', color='pdsi',
                         color_continuous_scale='Viridis_r',
                         range_color=(10, -10),
                         scope='usa',
@@ -170,7 +157,7 @@ def visualizeCountiesAllYears(dfDrought):
     for year in years[0:5]:
         print('generating map for year {0}'.format(year))
         df = dfDrought.loc[dfDrought['year'] >= year]
-        fig = px.choropleth(df, geojson=counties, locations='countyfips', color='pdsi',
+        fig = px.choropleth(df, geojson=getCounties(), locations='countyfips', color='pdsi',
                             color_continuous_scale='Viridis_r',
                             range_color=(10, -10),
                             scope='usa',
@@ -208,7 +195,8 @@ def stackedHistogram(dfDrought):
     fig.show()
 
 
-def knNeighbor(df: pd.DataFrame, title: str, name: str, mlTitle: str, quartile: str):
+def knNeighbor(df: pd.DataFrame, title: str, name: str, mlTitle: str, quartile: str, k: int = 10,
+               gridSize: int = 100):
     """K nearest neighbor regression lines
 
     Get the weighted and unweighted average of nearest plots to get the regression lines
@@ -219,7 +207,7 @@ def knNeighbor(df: pd.DataFrame, title: str, name: str, mlTitle: str, quartile:
         trendline='lowess',
         title=mlTitle
     )
-    kNn = kNearestNeighborModels(df)
+    kNn = kNearestNeighborModels(df, k, gridSize)
     xRange = kNn.get('xRange')
     yDist = kNn.get('yDist')
     yUni = kNn.get('yUni')
@@ -232,34 +220,29 @@ def knNeighbor(df: pd.DataFrame, title: str, name: str, mlTitle: str, quartile:
     exportPlotlyPNG(fig, name, 'visualizations/machineLearning')
 
 
-def genBubbleChart(df: pd.DataFrame, years, title: str, quartile: str, name: str, mlTitle: str):
+def genBubbleChart(df: pd.DataFrame, years, title: str, quartile: str, name: str, mlTitle: str,
+                   k: int = 10, gridSize: int = 100, cube: dict = None, mask: np.ndarray = None):
     """Generates bubble scatter plot for avg pdsi
 
     color - precipAvg mean of all counties present for the year
     size - pdsiAvg mean of all counties present for the year
     y - number of counties in lower pdsi quartile
     x - year
+
+    The county years come from df, or from the cube county years in mask when a cube is given
     """
-    x = []
-    y = []
-    size = []
-    color = []
-    for year in years:
-        currentYearData = df[df['year'] == year]
-        x.append(year)
-        y.append(currentYearData['pdsiAvg'].count())
-        preSize = currentYearData['pdsiAvg'].sum() * -1
-        if (preSize < 0):
-            size.append(1)
-        else:
-            size.append(abs(currentYearData['pdsiAvg'].mean()))
-        color.append(currentYearData['precipAvg'].mean())
+    if (cube == None):
+        dfSummary = yearlySummary(df, years, quantiles=[])
+    else:
+        dfSummary = cubeYearlySummary(cube, years, mask)
+    # counties drier than normal on the whole are sized by their mean pdsi, wetter years by 1
+    size = dfSummary['pdsiAvgMean'].abs().where(dfSummary['pdsiAvgSum'] <= 0, 1)
 
-    d = {'year': x, 'countyAmt': y, 'size': size,
-         'color': color}
+    d = {'year': list(years), 'countyAmt': dfSummary['pdsiAvgCount'].astype(int).to_numpy(),
+         'size': size.to_numpy(), 'color': dfSummary['precipAvgMean'].to_numpy()}
     df = pd.DataFrame(data=d)
 
-    knNeighbor(df, title, name, mlTitle, quartile)
+    knNeighbor(df, title, name, mlTitle, quartile, k, gridSize)
 
     fig = px.scatter(
         df,
@@ -370,7 +353,7 @@ def genCountyLowerQuartilePdsi(dfLowerQuartile: pd.DataFrame, name: str):
     """
     df = dfLowerQuartile
     df = df.loc[df['year'] >= 2001]
-    fig = px.choropleth(df, geojson=counties, locations='countyFips', color='precipAvg',
+    fig = px.choropleth(df, geojson=getCounties(), locations='countyFips', color='precipAvg',
                         title='Annual PDSI Lower Quartile for 2001 - 2016',
                         color_continuous_scale='Viridis_r',
                         range_color=(0, 10),
@@ -405,7 +388,7 @@ def genCountyLowerQuartilePrecip(dfLowerQuartile: pd.DataFrame, name: str):
     """
     df = dfLowerQuartile
     df = df.loc[df['year'] >= 2001]
-    fig = px.choropleth(df, geojson=counties, locations='countyFips', color='pdsiAvg',
+    fig = px.choropleth(df, geojson=getCounties(), locations='countyFips', color='pdsiAvg',
                         title='Annual Precipitation Lower Quartile for 2001 - 2016',
                         color_continuous_scale='Viridis_r',
                         range_color=(-10, 10),
@@ -436,10 +419,11 @@ def genCountyPDSICombined(dfAnnualMeans: pd.DataFrame, name: str, year: int = 19
     name: str - file name for export
     year: int - year for visualization
 
-    Returns: None
+    Returns:
+    bool - figure was exported
     """
     df = dfAnnualMeans.loc[dfAnnualMeans['year'] == year]
-    fig = px.choropleth(df, geojson=counties, locations='countyFips', color='pdsiAvg',
+    fig = px.choropleth(df, geojson=getCounties(), locations='countyFips', color='pdsiAvg',
                         title='Annual PDSI {0}'.format(str(year)),
                         color_continuous_scale='Viridis_r',
                         range_color=(10, -10),
@@ -448,7 +432,7 @@ def genCountyPDSICombined(dfAnnualMeans: pd.DataFrame, name: str, year: int = 19
                         )
     fig.update_layout(margin={'r': 0, 't': 50, 'l': 0, 'b': 0})
     # exportPlotlyHTML(fig, 'countyMap', 'visualizations/countyMaps/html')
-    exportPlotlyPNG(fig, name, 'visualizations/countyMaps')
+    return exportPlotlyPNG(fig, name, 'visualizations/countyMaps')
     # exportPlotlySVG(fig, 'countyMap2011', 'visualizations/countyMaps')
 
 
@@ -461,10 +445,11 @@ def genCountyPrecipCombined(dfAnnualMeans: pd.DataFrame, name: str, year: int =
     name: str - file name for export
     year: int - year for visualization
 
-    Returns: None
+    Returns:
+    bool - figure was exported
     """
     df = dfAnnualMeans.loc[dfAnnualMeans['year'] == year]
-    fig = px.choropleth(df, geojson=counties, locations='countyFips', color='precipAvg',
+    fig = px.choropleth(df, geojson=getCounties(), locations='countyFips', color='precipAvg',
                         title='Annual Precipitation {0}'.format(str(year)),
                         color_continuous_scale='Viridis_r',
                         range_color=(0, 10),
@@ -473,5 +458,121 @@ def genCountyPrecipCombined(dfAnnualMeans: pd.DataFrame, name: str, year: int =
                         )
     fig.update_layout(margin={'r': 0, 't': 50, 'l': 0, 'b': 0})
     # exportPlotlyHTML(fig, 'countyMap', 'visualizations/countyMaps/html')
-    exportPlotlyPNG(fig, name, 'visualizations/countyMaps')
+    return exportPlotlyPNG(fig, name, 'visualizations/countyMaps')
     # exportPlotlySVG(fig, 'countyMap2011', 'visualizations/countyMaps')
+
+
+def warmRenderer():
+    """Start the kaleido renderer in a pool worker so every figure in that worker reuses it"""
+    getCounties()
+    try:
+        go.Figure().to_image(format='png', width=8, height=8)
+    except Exception as err:
+        print('Could not warm kaleido renderer: {0}'.format(err))
+
+
+def countyMapName(metric: str, year: int):
+    """File name of the annual county map for a metric ('precip' or 'pdsi') and year"""
+    return ('annualAvgPrecip' if metric == 'precip' else 'annualAvgPDSI') + str(year)
+
+
+def renderCountyMap(metric: str, dfYear: pd.DataFrame, year: int):
+    """Render one annual county map, used as the process pool task
+
+    Parameters:
+    metric: str - 'precip' or 'pdsi'
+    dfYear: pd.DataFrame - annual means for the year
+    year: int - year for visualization
+
+    Returns:
+    (name, exported, error, cacheDelta, stageRecords): tuple - error is the export error text or
+        the traceback of the task, cacheDelta holds the render cache hits, renders, and failures
+        and stageRecords the instrumentation records of the task so the parent can count those
+        of worker processes
+    """
+    mark = len(records)
+    name = countyMapName(metric, year)
+    genCounty = genCountyPrecipCombined if metric == 'precip' else genCountyPDSICombined
+    before = cacheStats()
+    # errors left over from an earlier task of this process belong to another map
+    takeExportErrors()
+    try:
+        exported = genCounty(dfYear, name, year)
+        # the map is only done once its file is written
+        if (flushExports() > 0):
+            exported = False
+    except Exception:
+        exported = False
+        error = traceback.format_exc()
+    else:
+        error = None if exported else '; '.join(takeExportErrors()) or 'export failed'
+    after = cacheStats()
+    cacheDelta = {stat: after[stat] - before[stat] for stat in ['hits', 'rendered', 'failed']}
+    return (name, exported, error, cacheDelta, recordsSince(mark))
+
+
+def renderCountyMapsParallel(dfAnnualMeans: pd.DataFrame, years, workers: int = 4, cube: dict = None):
+    """Render the annual precip and pdsi county maps for every year across a process pool
+
+    Parameters:
+    dfAnnualMeans: pd.DataFrame - 'year', 'countyFips', 'pdsiAvg', 'precipAvg'
+    years: int[] - years to render
+    workers?: int - number of render processes, 1 renders in this process
+    cube?: dict - annualCube of dfAnnualMeans, built here when not given
+
+    Returns:
+    results: dict - 'exported': [names], 'failed': [(name, error)], 'cached': [names]
+        of the exported maps that were already up to date
+    """
+    # load the geometry once here so forked workers inherit it
+    getCounties()
+
+    # each task only carries its own year of data to the worker, sliced from the cube
+    if (cube == None):
+        cube = buildAnnualCube(dfAnnualMeans)
+    tasks = []
+    for year in years:
+        dfYear = yearFrame(cube, year)
+        tasks.append(('precip', dfYear, year))
+        tasks.append(('pdsi', dfYear, year))
+
+    results = {'exported': [], 'failed': [], 'cached': []}
+
+    def recordResult(result, done):
+        name, exported, error, cacheDelta, stageRecords = result
+        cached = exported and cacheDelta['hits'] > 0
+        if (exported):
+            results['exported'].append(name)
+        else:
+            results['failed'].append((name, error))
+        if (cached):
+            results['cached'].append(name)
+        print('[{0}/{1}] {2} {3}'.format(done, len(tasks), name,
+              ('up to date' if cached else 'exported') if exported else 'FAILED: {0}'.format(error)))
+
+    if (workers <= 1):
+        for done, task in enumerate(tasks, start=1):
+            recordResult(renderCountyMap(*task), done)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=warmRenderer) as pool:
+            futures = {pool.submit(renderCountyMap, *task): task for task in tasks}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # the remote traceback of the worker is chained to the exception
+                    metric, dfYear, year = futures[future]
+                    result = (countyMapName(metric, year), False,
+                              ''.join(traceback.format_exception(type(err), err, err.__traceback__)),
+                              {'hits': 0, 'rendered': 0, 'failed': 1}, [])
+                # worker processes count their own cache lookups and stages
+                mergeCacheStats(result[3])
+                mergeRecords(result[4])
+                recordResult(result, done)
+
+    print('Rendered {0} of {1} county maps ({2} up to date), {3} failed'.format(
+        len(results['exported']), len(tasks), len(results['cached']), len(results['failed'])))
+    for name, error in results['failed']:
+        print('Failed county map {0}: {1}'.format(name, error))
+
+    return results